@@ -1,129 +1,259 @@
 import tkinter as tk
-from tkinter import filedialog, Toplevel, messagebox
+from tkinter import filedialog
 from PIL import Image, ImageTk
 import cv2
-import os
-from datetime import datetime
-from model import PipelineModel
+from server import create_pipeline
+from tracker import VehicleTracker
+from motion import MotionGate
+from roi import RegionOfInterest
+from config import camera_settings, settings
+from storage import default_store
+from owners import OwnerIndex
+from camera import LatestFrameCapture
+from display import FrameRenderer, DetectionOverlay
 import threading
+import queue
+import time
 
-pipeline = PipelineModel(
-    car_model_path=r'D:\oman_car_plates\MODELS\vehicle_detection.pt',
-    plate_model_path=r'D:\oman_car_plates\MODELS\licensePlate.pt',
-    char_model_path=r'D:\oman_car_plates\MODELS\best(2).pt'
-)
+# Model paths come from config.py; the models load (or the shared inference
+# server is connected) in the background once the window is up (see
+# check_models_loaded)
+pipeline = create_pipeline(lazy=True)
+# With the inference server, video frames are decoded into a shared-memory ring
+# and only their slot is sent, instead of pickling each frame per request
+ring_slots = settings["server"]["ring_slots"] if hasattr(pipeline, "detect_shared") else 0
 
 cap = None
 file_path = None
 is_video = False
 show_plate = True
-frame_skip = 2  # Process every 2nd frame
+frame_skip = 2  # Process every 2nd frame while the scene is active
 frame_count = 0
-saved_plate_dir = "saved_plates"
-os.makedirs(saved_plate_dir, exist_ok=True)
+tracker = VehicleTracker()
+motion_gate = MotionGate(active_skip=frame_skip)
+gui_camera = camera_settings()
+camera_roi = RegionOfInterest.from_config(gui_camera)
+plate_store = default_store()
+owner_index = OwnerIndex()
+# The preview is redrawn at preview_fps while inference runs at most at the
+# camera's max_fps (0 = as fast as the models go)
+preview_interval_ms = max(1, int(1000 / settings["display"]["preview_fps"]))
+inference_fps = gui_camera["max_fps"]
+overlay = DetectionOverlay.from_config()
+result_queue = queue.Queue()
+generation = 0  # Bumped for every new run so results of the previous one are ignored
+processing_thread = None
+
+def save_plate_crop(plate_crop, track_id=None, text=""):
+    # Save the plate image off the inference path, sharded by date and hour
+    plate_store.save(plate_crop, track_id=track_id, text=text)
+
+# Save the single best plate crop of every vehicle that has left the scene, with
+# the track's final read (its consensus, or the read of that crop) in the index
+def finalize_tracks(tracks):
+    for track in tracks:
+        if track.best_plate is not None:
+            text = track.read.text if track.read is not None else ""
+            save_plate_crop(track.best_plate[4], track_id=track.id, text=text)
+
+# Detect cars every frame, but only read plates for new tracks or tracks whose
+# crop is likely to have improved. Returns the same shape as pipeline.read, with
+# the read of each track (its consensus once voting has settled). shared is the
+# (ring, slot, seq) of a frame in the capture's ring, which both stages then read
+# on the inference server.
+def track_vehicles(frame, shared=None):
+    if shared is not None:
+        car_boxes = pipeline.detect_cars_shared(*shared, roi=camera_roi)
+    else:
+        car_boxes = pipeline.detect_cars(frame, roi=camera_roi)
+    tracks, finished = tracker.update([tuple(map(int, box.xyxy[0])) for box in car_boxes])
+
+    pending = [track for track in tracks if track.needs_read()]
+    boxes = [track.box for track in pending]
+    if not pending:
+        results = []
+    elif shared is not None:
+        results = pipeline.read_vehicles_shared(*shared, boxes)
+    else:
+        results = pipeline.read_vehicles(frame, boxes)
+    for track, (plates, reads) in zip(pending, results):
+        track.add_read(plates, reads)
+    finalize_tracks(finished)
 
-def process_frame(frame):
-    car_boxes, plates, characters = pipeline.detect(frame)
-    img_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    read_tracks = [track for track in tracks if track.best_plate is not None]
+    return car_boxes, [track.best_plate for track in read_tracks], [track.read for track in read_tracks]
 
-    for box in car_boxes:
-        x1, y1, x2, y2 = map(int, box.xyxy[0])
-        cv2.rectangle(img_rgb, (x1, y1), (x2, y2), (0, 255, 0), 2)
+def process_frame(frame, use_tracker=False, shared=None):
+    if use_tracker:
+        car_boxes, plates, reads = track_vehicles(frame, shared)
+    else:
+        car_boxes, plates, reads = pipeline.read(frame)
 
     plate_img = None
     if plates:
-        px1, py1, px2, py2, plate_crop = plates[0]
-        cv2.rectangle(img_rgb, (px1, py1), (px2, py2), (255, 0, 0), 2)
-        plate_img = cv2.cvtColor(plate_crop, cv2.COLOR_BGR2RGB)
-        # Save the plate image with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        plate_filename = os.path.join(saved_plate_dir, f"plate_{timestamp}.png")
-        cv2.imwrite(plate_filename, cv2.cvtColor(plate_crop, cv2.COLOR_RGB2BGR))
+        plate_img = plates[0][4]
+        if not use_tracker:
+            save_plate_crop(plate_img)
     
-    return img_rgb, plate_img, characters
+    return car_boxes, plates, plate_img, reads
 
-def update_results(characters):
-    result_text = "Detection Results:\n"
-    filtered_labels = []
+# Draw the detections onto a copy of a still image
+def annotate_frame(frame, car_boxes, plates):
+    img_bgr = frame.copy()
+    for box in car_boxes:
+        x1, y1, x2, y2 = map(int, box.xyxy[0])
+        cv2.rectangle(img_bgr, (x1, y1), (x2, y2), (0, 255, 0), 2)
+    if plates:
+        px1, py1, px2, py2, _ = plates[0]
+        cv2.rectangle(img_bgr, (px1, py1), (px2, py2), (0, 0, 255), 2)
+    return img_bgr
+
+# Build the result text, one line per plate with its owner; each plate's text is
+# looked up on its own. Runs on the processing thread.
+def format_results(reads):
+    result_text = "Detection Results:"
+    found = False
     
     valid_labels = set(map(str, range(10)))  # Numbers 0-9
     valid_labels.update(chr(c) for c in range(65, 91))  # Letters A-Z
 
-    if characters:
-        for _, _, _, _, label in characters:
-            if label in valid_labels:
-                filtered_labels.append(label)
+    for read in reads:
+        filtered_labels = [label for label in read.text if label in valid_labels]
+        if not filtered_labels:
+            continue
+        found = True
+        result_text += "\n" + " ".join(filtered_labels)
+        match = owner_index.lookup("".join(filtered_labels))
+        if match:
+            record, distance = match
+            result_text += f"  Owner: {record['name']}" + (f" (~{distance})" if distance else "")
     
-    if filtered_labels:
-        result_text += " ".join(filtered_labels)
-    else:
-        result_text += "No valid characters detected."
+    if not found:
+        result_text += "\nNo valid characters detected."
     
-    result_label.config(text=result_text)
-
-def frame_processing_thread():
-    global cap, file_path, is_video, show_plate, frame_count
-
-    while True:
-        if is_video:
-            ret, frame = cap.read()
-            if not ret:
-                cap.release()
-                is_video = False
-                result_label.config(text="Video ended or failed to capture frame")
+    return result_text
+
+# Hand a result to the Tk thread; results of an older run are dropped there
+def post_result(kind, run_generation, payload):
+    result_queue.put((kind, run_generation, payload))
+
+# Inference thread. It never touches Tk widgets: a video feeds the overlay and
+# result_queue, and the display loop (refresh_display) draws the live frames at
+# preview rate. Inference is capped at the camera's max_fps.
+def frame_processing_thread(run_generation):
+    global is_video, frame_count
+
+    if is_video:
+        source = cap
+        min_interval = 1.0 / inference_fps if inference_fps else 0
+        while generation == run_generation:
+            started = time.monotonic()
+            item = source.read_shared(timeout=1.0)
+            if generation != run_generation:
                 break
-
-            if frame_count % frame_skip == 0:
-                img_rgb, plate_img, characters = process_frame(frame)
-                
-                img_tk = ImageTk.PhotoImage(Image.fromarray(img_rgb))
-                video_frame_left.config(image=img_tk)
-                video_frame_left.image = img_tk
-
-                if show_plate and plate_img is not None:
-                    plate_img_tk = ImageTk.PhotoImage(Image.fromarray(plate_img))
-                    video_frame_right.config(image=plate_img_tk)
-                    video_frame_right.image = plate_img_tk
-                else:
-                    video_frame_right.config(image='')
-
-                update_results(characters)
+            if item is None:
+                if source.ended:
+                    is_video = False
+                    finalize_tracks(tracker.flush())
+                    post_result("status", run_generation, "Video ended or failed to capture frame")
+                    break
+                continue
+
+            _, frame, shared = item
+            captured = time.monotonic()
+            if motion_gate.should_process(frame):
+                try:
+                    _, _, plate_img, reads = process_frame(frame, use_tracker=True, shared=shared)
+                except Exception as exc:
+                    post_result("status", run_generation, f"Detection failed: {exc}")
+                    continue
+                motion_gate.set_vehicles_present(tracker.tracks)
+                active = [track for track in tracker.tracks if track.missed == 0]
+                overlay.update([track.box for track in active], [track.id for track in active], timestamp=captured)
+                post_result("plate", run_generation, (plate_img, format_results(reads)))
             
             frame_count += 1
-        elif file_path:
-            frame = cv2.imread(file_path)
-            if frame is not None:
-                img_rgb, plate_img, characters = process_frame(frame)
-                
-                img_tk = ImageTk.PhotoImage(Image.fromarray(img_rgb))
-                video_frame_left.config(image=img_tk)
-                video_frame_left.image = img_tk
-
-                if show_plate and plate_img is not None:
-                    plate_img_tk = ImageTk.PhotoImage(Image.fromarray(plate_img))
-                    video_frame_right.config(image=plate_img_tk)
-                    video_frame_right.image = plate_img_tk
-                else:
-                    video_frame_right.config(image='')
-
-                update_results(characters)
-            else:
-                result_label.config(text="Failed to load image")
+            delay = min_interval - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+    elif file_path:
+        frame = cv2.imread(file_path)
+        if frame is not None:
+            car_boxes, plates, plate_img, reads = process_frame(frame)
+            post_result("still", run_generation, annotate_frame(frame, car_boxes, plates))
+            post_result("plate", run_generation, (plate_img, format_results(reads)))
+        else:
+            post_result("status", run_generation, "Failed to load image")
 
 def start_frame_processing():
-    threading.Thread(target=frame_processing_thread, daemon=True).start()
-
-def stop_detection():
-    global cap
+    global processing_thread
+    processing_thread = threading.Thread(target=frame_processing_thread, args=(generation,), daemon=True)
+    processing_thread.start()
+
+# Display loop on the Tk thread, every preview_interval_ms. A running video is
+# redrawn from the capture's latest frame with the overlay on top, so the
+# preview stays smooth however slow inference is; results of the processing
+# thread are applied as they arrive.
+def refresh_display():
+    still = plate_result = status = None
+    while True:
+        try:
+            kind, result_generation, payload = result_queue.get_nowait()
+        except queue.Empty:
+            break
+        if result_generation != generation:
+            continue
+        if kind == "still":
+            still = payload
+        elif kind == "plate":
+            plate_result = payload
+            status = payload[1]
+        else:
+            status = payload
+
+    source = cap
+    if is_video and source is not None:
+        _, frame = source.latest()
+        if frame is not None:
+            video_renderer.render(frame, overlay)
+    elif still is not None:
+        video_renderer.render(still)
+
+    if plate_result is not None:
+        plate_img = plate_result[0]
+        if show_plate and plate_img is not None:
+            plate_renderer.render(plate_img)
+        else:
+            plate_renderer.clear()
+    if status is not None:
+        result_label.config(text=status)
+
+    root.after(preview_interval_ms, refresh_display)
+
+# Stop the current video or image run. Once its thread has exited, the best
+# crop of every vehicle still in view is saved and the tracker starts empty.
+def stop_current_run():
+    global cap, is_video, generation
+    generation += 1
+    is_video = False
     if cap:
         cap.release()
+    cap = None
+    if processing_thread is not None:
+        processing_thread.join()
+    finalize_tracks(tracker.flush())
+    overlay.clear()
+
+def stop_detection():
+    stop_current_run()
+    plate_store.writer.flush()
     root.quit()
 
 def upload_image():
     global file_path, is_video, show_plate, frame_count
     file_path = filedialog.askopenfilename(filetypes=[("Image Files", "*.jpg;*.jpeg;*.png")])
     if file_path:
-        is_video = False
+        stop_current_run()
         show_plate = True
         frame_count = 0
         result_label.config(text=f"Loaded image: {file_path}")
@@ -133,72 +263,22 @@ def upload_video():
     global cap, file_path, is_video, show_plate, frame_count
     file_path = filedialog.askopenfilename(filetypes=[("Video Files", "*.mp4;*.avi")])
     if file_path:
-        cap = cv2.VideoCapture(file_path)
+        stop_current_run()
+        # Frames are grabbed (paced at the video's frame rate) on their own thread;
+        # the preview and the inference thread both take the latest one
+        cap = LatestFrameCapture(file_path, ring_slots=ring_slots)
+        motion_gate.reset()
         is_video = True
         show_plate = True
         frame_count = 0
         result_label.config(text=f"Loaded video: {file_path}")
         start_frame_processing()
 
-def delete_plate(plate_file):
-    os.remove(plate_file)
-    show_saved_plates()  # Refresh the plate list
-    messagebox.showinfo("Info", "Plate image deleted.")
-
+# The saved-plates browser of table.py pages through the store and loads
+# thumbnails in the background
 def show_saved_plates():
-    plate_window = Toplevel(root)
-    plate_window.title("Saved Plates")
-    plate_window.geometry("800x600")
-
-    canvas = tk.Canvas(plate_window)
-    scrollbar = tk.Scrollbar(plate_window, orient="vertical", command=canvas.yview)
-    scrollable_frame = tk.Frame(canvas)
-
-    scrollable_frame.bind(
-        "<Configure>",
-        lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-    )
-
-    canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-    scrollbar.pack(side="right", fill="y")
-    canvas.pack(side="left", fill="both", expand=True)
-    canvas.configure(yscrollcommand=scrollbar.set)
-
-    # Create table headers
-    tk.Label(scrollable_frame, text="Image", borderwidth=2, relief="ridge").grid(row=0, column=0, padx=5, pady=5)
-    tk.Label(scrollable_frame, text="Timestamp", borderwidth=2, relief="ridge").grid(row=0, column=1, padx=5, pady=5)
-    tk.Label(scrollable_frame, text="Actions", borderwidth=2, relief="ridge").grid(row=0, column=2, padx=5, pady=5)
-
-    row = 1
-    for file_name in os.listdir(saved_plate_dir):
-        if file_name.endswith(".png"):
-            plate_path = os.path.join(saved_plate_dir, file_name)
-            plate_img = Image.open(plate_path)
-            plate_img.thumbnail((200, 200))
-            plate_img_tk = ImageTk.PhotoImage(plate_img)
-            
-            # Image
-            tk.Label(scrollable_frame, image=plate_img_tk, borderwidth=2, relief="ridge").grid(row=row, column=0, padx=5, pady=5)
-            # Timestamp
-            timestamp = file_name.split('_')[1].split('.')[0]
-            tk.Label(scrollable_frame, text=timestamp, borderwidth=2, relief="ridge").grid(row=row, column=1, padx=5, pady=5)
-            # Actions
-            action_frame = tk.Frame(scrollable_frame)
-            tk.Button(action_frame, text="Save", command=lambda p=plate_path: save_plate(p)).pack(side="left", padx=5)
-            tk.Button(action_frame, text="Delete", command=lambda p=plate_path: delete_plate(p)).pack(side="left", padx=5)
-            action_frame.grid(row=row, column=2, padx=5, pady=5)
-            
-            # Keep a reference to avoid garbage collection
-            scrollable_frame.image_list = scrollable_frame.image_list if hasattr(scrollable_frame, 'image_list') else []
-            scrollable_frame.image_list.append(plate_img_tk)
-
-            row += 1
-
-def save_plate(plate_file):
-    save_path = filedialog.asksaveasfilename(defaultextension=".png", filetypes=[("PNG files", "*.png")], initialfile=os.path.basename(plate_file))
-    if save_path:
-        os.rename(plate_file, save_path)
-        messagebox.showinfo("Info", "Plate image saved successfully.")
+    import table
+    table.show_saved_plates(root)
 
 root = tk.Tk()
 root.title("Real-Time Omani Car Detection Pipeline")
@@ -217,6 +297,9 @@ video_frame_left.grid(row=1, column=0, rowspan=8, columnspan=2, padx=10, pady=10
 video_frame_right = tk.Label(root, bg="black", fg="white", font=("Courier New", 16), relief="ridge", borderwidth=2)
 video_frame_right.grid(row=1, column=2, rowspan=8, columnspan=2, padx=10, pady=10, sticky="nsew")
 
+video_renderer = FrameRenderer(video_frame_left)
+plate_renderer = FrameRenderer(video_frame_right)
+
 controls_frame = tk.Frame(root, bg="black")
 controls_frame.grid(row=0, column=2, rowspan=1, columnspan=2, padx=10, pady=10, sticky="ne")
 
@@ -241,8 +324,28 @@ root.grid_columnconfigure(1, weight=1)
 root.grid_columnconfigure(2, weight=1)
 root.grid_columnconfigure(3, weight=1)
 
+# Keep detection disabled until the models are loaded; loading and a warm-up
+# inference run off the UI thread so the window appears immediately
+def check_models_loaded():
+    if not pipeline.ready.is_set():
+        root.after(200, check_models_loaded)
+    elif pipeline.load_error is not None:
+        result_label.config(text=f"Failed to load models: {pipeline.load_error}")
+    else:
+        for button in (upload_image_button, upload_video_button):
+            button.config(state="normal")
+        result_label.config(text="Models ready.")
+
+for button in (upload_image_button, upload_video_button):
+    button.config(state="disabled")
+result_label.config(text="Loading models...")
+pipeline.load_async()
+root.after(200, check_models_loaded)
+root.after(preview_interval_ms, refresh_display)
+
 root.mainloop()
 
-if cap:
-    cap.release()
+# Also saves the tracks of a video that was still playing when the window closed
+stop_current_run()
+plate_store.close()
 cv2.destroyAllWindows()
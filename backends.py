@@ -0,0 +1,245 @@
+import argparse
+import ast
+import os
+import time
+
+import cv2
+import numpy as np
+
+from plate_text import batched_nms
+
+
+# Detections of one image as an (N, 6) array of x1, y1, x2, y2, conf, cls. Rows
+# behave like ultralytics boxes (box.xyxy[0], box.conf, box.cls), so callers
+# that draw car boxes work with every backend.
+class Detections:
+    def __init__(self, data):
+        self.data = np.asarray(data, dtype=np.float32).reshape(-1, 6)
+
+    @property
+    def xyxy(self):
+        return self.data[:, :4]
+
+    @property
+    def conf(self):
+        return self.data[:, 4]
+
+    @property
+    def cls(self):
+        return self.data[:, 5]
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        for i in range(len(self.data)):
+            yield Detections(self.data[i:i + 1])
+
+    def __getitem__(self, index):
+        return Detections(self.data[index])
+
+
+# Runs a model through ultralytics: PyTorch .pt files, or any format ultralytics
+# loads itself (e.g. an exported OpenVINO directory).
+class UltralyticsBackend:
+    def __init__(self, path, conf=0.25, iou=0.7, **_):
+        from ultralytics import YOLO
+        self.model = YOLO(path)
+        self.names = self.model.names
+        self.conf = conf
+        self.iou = iou
+
+    # Ultralytics letterboxes every image to the model size, so images of
+    # different shapes share one batch
+    def predict(self, images):
+        results = self.model.predict(images, verbose=False, conf=self.conf, iou=self.iou)
+        return [Detections(result.boxes.data[:, :6].cpu().numpy()) for result in results]
+
+
+# Runs an exported YOLO ONNX model with ONNX Runtime. Thread counts are set on the
+# session, which matters on small fanless CPUs where the defaults oversubscribe.
+class OnnxBackend:
+    def __init__(self, path, conf=0.25, iou=0.7, intra_op_threads=0, inter_op_threads=1, max_det=300, **_):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = int(intra_op_threads)
+        options.inter_op_num_threads = int(inter_op_threads)
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input = self.session.get_inputs()[0]
+        batch, _, height, width = self.input.shape
+        self.imgsz = (height if isinstance(height, int) else 640, width if isinstance(width, int) else 640)
+        self.dynamic_batch = not isinstance(batch, int)
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        # Without names metadata the class ids themselves are used as labels
+        self.names = ast.literal_eval(metadata["names"]) if "names" in metadata else None
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+
+    # Resize keeping the aspect ratio and pad to the model size, as ultralytics does
+    def _letterbox(self, image):
+        height, width = image.shape[:2]
+        scale = min(self.imgsz[0] / height, self.imgsz[1] / width)
+        new_w, new_h = int(round(width * scale)), int(round(height * scale))
+        pad_x, pad_y = (self.imgsz[1] - new_w) / 2, (self.imgsz[0] - new_h) / 2
+        resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        top, left = int(round(pad_y - 0.1)), int(round(pad_x - 0.1))
+        padded = cv2.copyMakeBorder(resized, top, self.imgsz[0] - new_h - top, left, self.imgsz[1] - new_w - left,
+                                    cv2.BORDER_CONSTANT, value=(114, 114, 114))
+        blob = cv2.cvtColor(padded, cv2.COLOR_BGR2RGB).transpose(2, 0, 1).astype(np.float32) / 255.0
+        return blob, (scale, left, top, width, height)
+
+    # YOLOv8 output is (4 + classes, anchors) per image with boxes as cx, cy, w, h
+    def _postprocess(self, output, meta):
+        scale, left, top, width, height = meta
+        pred = output.T
+        scores = pred[:, 4:]
+        cls = scores.argmax(axis=1)
+        conf = scores[np.arange(len(scores)), cls]
+        mask = conf >= self.conf
+        pred, cls, conf = pred[mask], cls[mask], conf[mask]
+        boxes = np.empty((len(pred), 4), dtype=np.float32)
+        boxes[:, 0] = pred[:, 0] - pred[:, 2] / 2
+        boxes[:, 1] = pred[:, 1] - pred[:, 3] / 2
+        boxes[:, 2] = pred[:, 0] + pred[:, 2] / 2
+        boxes[:, 3] = pred[:, 1] + pred[:, 3] / 2
+        keep = batched_nms(boxes, conf, cls, self.iou)
+        keep = keep[np.argsort(-conf[keep], kind="stable")][:self.max_det]
+        boxes = (boxes[keep] - np.array([left, top, left, top], dtype=np.float32)) / scale
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+        return Detections(np.column_stack([boxes, conf[keep], cls[keep]]))
+
+    def predict(self, images):
+        prepared = [self._letterbox(image) for image in images]
+        if self.dynamic_batch:
+            batch = np.stack([blob for blob, _ in prepared])
+            outputs = self.session.run(None, {self.input.name: batch})[0]
+        else:
+            outputs = [self.session.run(None, {self.input.name: blob[None]})[0][0] for blob, _ in prepared]
+        return [self._postprocess(output, meta) for output, (_, meta) in zip(outputs, prepared)]
+
+
+# Where export_model puts (and load_model finds) the exported copy of a .pt file
+def exported_path(pt_path, backend):
+    stem = os.path.splitext(pt_path)[0]
+    if backend == "onnx":
+        return stem + ".onnx"
+    if backend == "openvino":
+        return stem + "_openvino_model"
+    return pt_path
+
+
+# Export a .pt model once; ONNX is exported with a dynamic batch axis so the
+# batched stages of PipelineModel run as a single session call.
+def export_model(pt_path, backend="onnx", imgsz=640):
+    from ultralytics import YOLO
+    model = YOLO(pt_path)
+    if backend == "onnx":
+        return model.export(format="onnx", dynamic=True, simplify=True, imgsz=imgsz)
+    if backend == "openvino":
+        return model.export(format="openvino", imgsz=imgsz)
+    raise ValueError(f"Unknown backend: {backend}")
+
+
+# Load a model given the path of its .pt file and its entry in config "models".
+# The entry's path, when set, overrides where the exported model is found.
+def load_model(pt_path, spec=None):
+    spec = dict(spec or {})
+    backend = spec.pop("backend", "ultralytics")
+    path = spec.pop("path", None) or exported_path(pt_path, backend)
+    if backend == "onnx":
+        return OnnxBackend(path, **spec)
+    if backend in ("ultralytics", "openvino"):
+        return UltralyticsBackend(path, **spec)
+    raise ValueError(f"Unknown backend: {backend}")
+
+
+def _box_iou(a, b):
+    ix1, iy1 = np.maximum(a[0], b[0]), np.maximum(a[1], b[1])
+    ix2, iy2 = np.minimum(a[2], b[2]), np.minimum(a[3], b[3])
+    inter = max(0.0, ix2 - ix1) * max(0.0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+# Equivalence check of a candidate backend against the reference (PyTorch) one:
+# every reference box must be matched by a candidate box of the same class with
+# IoU >= iou_threshold. Returns the match rate, worst confidence difference,
+# extra candidate boxes and the mean latency of both.
+def compare_backends(reference, candidate, images, iou_threshold=0.9):
+    matched = total = extra = 0
+    max_conf_delta = 0.0
+    timings = {"reference": 0.0, "candidate": 0.0}
+    for image in images:
+        start = time.perf_counter()
+        expected = reference.predict([image])[0]
+        timings["reference"] += time.perf_counter() - start
+        start = time.perf_counter()
+        actual = candidate.predict([image])[0]
+        timings["candidate"] += time.perf_counter() - start
+
+        used = set()
+        for row in expected.data:
+            total += 1
+            best, best_iou = None, iou_threshold
+            for j, other in enumerate(actual.data):
+                if j not in used and other[5] == row[5]:
+                    iou = _box_iou(row[:4], other[:4])
+                    if iou >= best_iou:
+                        best, best_iou = j, iou
+            if best is not None:
+                used.add(best)
+                matched += 1
+                max_conf_delta = max(max_conf_delta, abs(float(row[4] - actual.data[best][4])))
+        extra += len(actual) - len(used)
+    count = max(len(images), 1)
+    return {
+        "match_rate": matched / total if total else 1.0,
+        "max_conf_delta": max_conf_delta,
+        "extra_boxes": extra,
+        "reference_ms": 1000 * timings["reference"] / count,
+        "candidate_ms": 1000 * timings["candidate"] / count,
+    }
+
+
+def _read_images(directory):
+    images = []
+    for name in sorted(os.listdir(directory)):
+        image = cv2.imread(os.path.join(directory, name))
+        if image is not None:
+            images.append(image)
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the gate models and check exported backends.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="export .pt models to ONNX or OpenVINO")
+    export.add_argument("models", nargs="+")
+    export.add_argument("--backend", choices=["onnx", "openvino"], default="onnx")
+    export.add_argument("--imgsz", type=int, default=640)
+    compare = commands.add_parser("compare", help="compare an exported model with its .pt original")
+    compare.add_argument("model")
+    compare.add_argument("images", help="directory of test images")
+    compare.add_argument("--backend", choices=["onnx", "openvino"], default="onnx")
+    compare.add_argument("--iou", type=float, default=0.9)
+    compare.add_argument("--min-match", type=float, default=0.95)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        for model in args.models:
+            print(export_model(model, args.backend, args.imgsz))
+        return 0
+
+    report = compare_backends(load_model(args.model), load_model(args.model, {"backend": args.backend}),
+                              _read_images(args.images), args.iou)
+    for key, value in report.items():
+        print(f"{key}: {value:.4f}" if isinstance(value, float) else f"{key}: {value}")
+    return 0 if report["match_rate"] >= args.min_match else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,285 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import cv2
+
+from config import camera_settings
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov")
+
+CSV_FIELDS = ["source", "frame", "timestamp", "x1", "y1", "x2", "y2", "text", "confidence"]
+
+# Set in every worker process by _init_worker
+_pipeline = None
+_results = None
+_roi = None
+_executor = None
+
+
+# Expand the command line inputs into tasks: one per video, and images in groups
+# of images_per_task so a directory of stills does not become one task per file
+def find_tasks(inputs, images_per_task):
+    videos, images = [], []
+    for path in inputs:
+        if os.path.isdir(path):
+            names = [os.path.join(directory, name) for directory, _, files in os.walk(path) for name in files]
+        else:
+            names = [path]
+        for name in sorted(names):
+            extension = os.path.splitext(name)[1].lower()
+            if extension in VIDEO_EXTENSIONS:
+                videos.append(name)
+            elif extension in IMAGE_EXTENSIONS:
+                images.append(name)
+    tasks = [("video", [video]) for video in videos]
+    for start in range(0, len(images), images_per_task):
+        tasks.append(("images", images[start:start + images_per_task]))
+    return tasks
+
+
+# With pipelined, each worker also runs its models as an executor.PipelinedExecutor
+# so the car, plate and char stages of consecutive frames overlap
+def _init_worker(results, camera, model_paths, pipelined=False, batch_size=4):
+    global _pipeline, _results, _roi, _executor
+    from model import PipelineModel
+    from roi import RegionOfInterest
+    _results = results
+    _roi = RegionOfInterest.from_config(camera_settings(camera)) if camera else None
+    _pipeline = PipelineModel(*model_paths)
+    if pipelined:
+        from executor import PipelinedExecutor
+        _executor = PipelinedExecutor(_pipeline, max_batch=batch_size, reads=True).start()
+
+
+def _plate_confidence(read):
+    return round(float(min(read.confidences)), 3) if read.confidences else 0.0
+
+
+# One output record per frame: the car boxes (x1, y1, x2, y2, conf) and every
+# plate box with its text
+def _record(source, frame_index, timestamp, result):
+    car_boxes, plates, reads = result
+    return {
+        "source": source,
+        "frame": frame_index,
+        "timestamp": timestamp,
+        "cars": [[int(x1), int(y1), int(x2), int(y2), round(float(conf), 3)]
+                 for x1, y1, x2, y2, conf in car_boxes.data[:, :5]],
+        "plates": [{"box": [int(value) for value in plate[:4]], "text": read.text,
+                    "confidence": _plate_confidence(read)}
+                   for plate, read in zip(plates, reads)],
+    }
+
+
+# Send records to the parent. Returns the number of plates found.
+def _send(records, keep_empty):
+    records = [record for record in records if keep_empty or record["cars"]]
+    if records:
+        _results.put(("records", records))
+    return sum(len(record["plates"]) for record in records)
+
+
+# Run one batch of (source, frame_index, timestamp, frame) through the cascade
+# and send the records to the parent. Returns the number of plates found.
+def _flush(batch, keep_empty):
+    if not batch:
+        return 0
+    results = _pipeline.read_batch([item[3] for item in batch], [_roi] * len(batch))
+    return _send([_record(source, frame_index, timestamp, result)
+                  for (source, frame_index, timestamp, _), result in zip(batch, results)], keep_empty)
+
+
+# Pipelined form of the batch loop: frames go into the executor one at a time
+# and records are sent in frame order, batch_size at a time, as they complete.
+# Returns (frames, plates).
+def _run_pipelined(items, batch_size, keep_empty):
+    frames = plates = 0
+    pending = deque()
+    records = []
+    for item in items:
+        pending.append((item, _executor.submit(item[3], _roi)))
+        frames += 1
+        while pending and pending[0][1].done():
+            (source, frame_index, timestamp, _), future = pending.popleft()
+            records.append(_record(source, frame_index, timestamp, future.result()))
+        if len(records) >= batch_size:
+            plates += _send(records, keep_empty)
+            records = []
+    for (source, frame_index, timestamp, _), future in pending:
+        records.append(_record(source, frame_index, timestamp, future.result()))
+    return frames, plates + _send(records, keep_empty)
+
+
+# Frames of a video, every stride-th one, as (source, frame_index, timestamp,
+# frame) with the timestamp in seconds into the video
+def _video_frames(source, stride):
+    capture = cv2.VideoCapture(source)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 0
+    frame_index = -1
+    try:
+        while capture.grab():
+            frame_index += 1
+            if frame_index % stride:
+                continue
+            ret, frame = capture.retrieve()
+            if not ret:
+                break
+            if fps > 0:
+                timestamp = round(frame_index / fps, 3)
+            else:
+                timestamp = round(capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0, 3)
+            yield source, frame_index, timestamp, frame
+    finally:
+        capture.release()
+
+
+# Images of a group, each reported under its own name with its modification time
+def _image_frames(paths):
+    for path in paths:
+        frame = cv2.imread(path)
+        if frame is not None:
+            timestamp = datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y-%m-%d %H:%M:%S")
+            yield path, 0, timestamp, frame
+
+
+# Worker task: a video or a group of images. Frames go through the models
+# batch_size at a time. Always ends with a "done" message to the parent.
+def process_task(task_id, kind, paths, batch_size, stride, keep_empty):
+    started = time.monotonic()
+    frames = plates = 0
+    error = None
+    try:
+        batch = []
+        items = _video_frames(paths[0], stride) if kind == "video" else _image_frames(paths)
+        if _executor is not None:
+            frames, plates = _run_pipelined(items, batch_size, keep_empty)
+        else:
+            for item in items:
+                batch.append(item)
+                frames += 1
+                if len(batch) == batch_size:
+                    plates += _flush(batch, keep_empty)
+                    batch = []
+            plates += _flush(batch, keep_empty)
+    except Exception as exc:
+        error = f"{type(exc).__name__}: {exc}"
+    _results.put(("done", task_id, {"paths": paths, "frames": frames, "plates": plates,
+                                    "seconds": round(time.monotonic() - started, 1), "error": error,
+                                    "pipeline": _executor.stats() if _executor is not None else None}))
+
+
+# Writes records as JSON Lines (one frame per line) or CSV (one plate per row)
+class ResultWriter:
+    def __init__(self, output, output_format):
+        self.file = sys.stdout if output == "-" else open(output, 'w', newline='')
+        self.csv = None
+        if output_format == "csv":
+            self.csv = csv.writer(self.file)
+            self.csv.writerow(CSV_FIELDS)
+
+    def write(self, records):
+        for record in records:
+            if self.csv is None:
+                self.file.write(json.dumps(record) + "\n")
+                continue
+            for plate in record["plates"]:
+                self.csv.writerow([record["source"], record["frame"], record["timestamp"]]
+                                  + plate["box"] + [plate["text"], plate["confidence"]])
+        self.file.flush()
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+# Worker throughput and the peak queue depth of each stage, for --pipelined
+def _pipeline_summary(stats):
+    if not stats:
+        return ""
+    peak = stats["peak_queue_depth"]
+    return (f"; worker {stats['throughput_fps']:.1f} fps, peak queues "
+            f"car {peak['car']} / plate {peak['plate']} / char {peak['char']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the plate pipeline over video files and image directories.")
+    parser.add_argument("inputs", nargs="+", help="video files, images or directories (searched recursively)")
+    parser.add_argument("--output", "-o", default="-", help="result file (default: stdout)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="default: from the output extension, else jsonl")
+    parser.add_argument("--workers", type=int, default=2, help="processes, each loading its own copy of the models")
+    parser.add_argument("--batch-size", type=int, default=8, help="frames per inference call within a file")
+    parser.add_argument("--stride", type=int, default=1, help="process every Nth frame of a video")
+    parser.add_argument("--images-per-task", type=int, default=64)
+    parser.add_argument("--camera", help="apply the region of interest of this camera from config")
+    parser.add_argument("--keep-empty", action="store_true", help="also write frames without vehicles")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="overlap the car, plate and char stages of consecutive frames in each worker")
+    parser.add_argument("--car-model")
+    parser.add_argument("--plate-model")
+    parser.add_argument("--char-model")
+    args = parser.parse_args()
+
+    if args.camera:
+        try:
+            camera_settings(args.camera)
+        except ValueError as exc:
+            parser.error(str(exc))
+
+    output_format = args.format or ("csv" if args.output.lower().endswith(".csv") else "jsonl")
+    tasks = find_tasks(args.inputs, max(1, args.images_per_task))
+    if not tasks:
+        parser.error("no videos or images found")
+
+    writer = ResultWriter(args.output, output_format)
+    results = multiprocessing.Queue(maxsize=256)
+    model_paths = (args.car_model, args.plate_model, args.char_model)
+    started = time.monotonic()
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.workers), initializer=_init_worker,
+                             initargs=(results, args.camera, model_paths, args.pipelined,
+                                       max(1, args.batch_size))) as pool:
+        futures = {pool.submit(process_task, task_id, kind, paths, max(1, args.batch_size),
+                               max(1, args.stride), args.keep_empty): task_id
+                   for task_id, (kind, paths) in enumerate(tasks)}
+        remaining = set(futures.values())
+        while remaining:
+            try:
+                message, *payload = results.get(timeout=1.0)
+            except queue.Empty:
+                # A worker that died (e.g. failed to load the models) never reports done
+                for future, task_id in futures.items():
+                    if task_id in remaining and future.done() and future.exception() is not None:
+                        remaining.discard(task_id)
+                        failed += 1
+                        print(f"failed: {tasks[task_id][1][0]}: {future.exception()}", file=sys.stderr, flush=True)
+                continue
+            if message == "records":
+                writer.write(payload[0])
+                continue
+            task_id, summary = payload
+            remaining.discard(task_id)
+            name = summary["paths"][0] if len(summary["paths"]) == 1 else f"{len(summary['paths'])} images"
+            if summary["error"]:
+                failed += 1
+                print(f"failed: {name}: {summary['error']}", file=sys.stderr, flush=True)
+            else:
+                print(f"{name}: {summary['frames']} frames, {summary['plates']} plates in {summary['seconds']}s "
+                      f"({len(tasks) - len(remaining)}/{len(tasks)}){_pipeline_summary(summary['pipeline'])}",
+                      file=sys.stderr, flush=True)
+    writer.close()
+    print(f"Processed {len(tasks)} tasks in {time.monotonic() - started:.1f}s, {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+
+import cv2
+
+from shm_frames import FrameRing
+
+
+# Grabs frames from a cv2.VideoCapture on its own thread and keeps only the most
+# recent one, so a slow consumer always gets the freshest frame instead of a
+# growing backlog. Frames replaced before anyone read them are counted as
+# dropped. Video files are paced at their own frame rate so they play back like
+# a live camera. With ring_slots, frames are decoded straight into a
+# shm_frames.FrameRing of that many slots (made from the first frame, and again
+# whenever the size changes), so the inference server can read them without a
+# copy; frames are then views of the ring, valid until it laps them.
+class LatestFrameCapture:
+    def __init__(self, source, paced=None, ring_slots=0):
+        self.source = source
+        self.cap = cv2.VideoCapture(source)
+        self.paced = paced if paced is not None else (isinstance(source, str) and os.path.isfile(source))
+        self.ring_slots = ring_slots
+        self.ring = None
+        self.frame = None
+        self.shared = None
+        self.frame_id = 0
+        self.read_id = 0
+        self.grabbed = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.ended = False
+        self._condition = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"capture-{source}", daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self):
+        return self._running and not self.ended
+
+    # The next frame as (frame, shared), shared being (ring, slot, seq) in ring
+    # mode and None otherwise; None once the source has no more frames
+    def _grab(self):
+        if not self.ring_slots:
+            ret, frame = self.cap.read()
+            return (frame, None) if ret else None
+        if self.ring is not None:
+            try:
+                written = self.ring.read_capture(self.cap)
+            except ValueError:
+                # The stream changed size; the next frame starts a new ring
+                self._close_ring()
+            else:
+                if written is None:
+                    return None
+                slot, seq = written
+                return self.ring.frames[slot], (self.ring, slot, seq)
+        ret, frame = self.cap.read()
+        if not ret:
+            return None
+        self.ring = FrameRing.create(self.ring_slots, frame.shape, frame.dtype)
+        slot, seq = self.ring.write(frame)
+        return self.ring.frames[slot], (self.ring, slot, seq)
+
+    def _close_ring(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def _run(self):
+        fps = self.cap.get(cv2.CAP_PROP_FPS) if self.paced else 0
+        interval = 1.0 / fps if fps and fps > 0 else 0
+        next_time = time.monotonic()
+        while self._running:
+            grabbed = self._grab()
+            if grabbed is None:
+                break
+            with self._condition:
+                if self.frame_id > self.read_id:
+                    self.dropped += 1
+                self.frame, self.shared = grabbed
+                self.frame_id += 1
+                self.grabbed += 1
+                self._condition.notify_all()
+            if interval:
+                next_time += interval
+                delay = next_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_time = time.monotonic()
+        with self._condition:
+            self.ended = True
+            self._condition.notify_all()
+        self.cap.release()
+        self._close_ring()
+
+    # Wait for a frame newer than the last one returned and give back
+    # (frame_id, frame). Returns None on timeout or once the source has ended.
+    def read(self, timeout=None):
+        item = self.read_shared(timeout)
+        return item[:2] if item is not None else None
+
+    # Like read, as (frame_id, frame, shared) with shared the (ring, slot, seq)
+    # of the frame in ring mode and None otherwise
+    def read_shared(self, timeout=None):
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.frame_id > self.read_id or self.ended, timeout):
+                return None
+            if self.frame_id == self.read_id:
+                return None
+            self.read_id = self.frame_id
+            self.delivered += 1
+            return self.frame_id, self.frame, self.shared
+
+    # The newest frame without waiting or marking it as read, e.g. for previews
+    def latest(self):
+        with self._condition:
+            return self.frame_id, self.frame
+
+    def stats(self):
+        with self._condition:
+            return {"grabbed": self.grabbed, "delivered": self.delivered, "dropped": self.dropped}
+
+    def release(self):
+        self._running = False
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
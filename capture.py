@@ -1,12 +1,12 @@
 import tkinter as tk
 from tkinter import messagebox
-from PIL import Image, ImageTk
 import cv2
-from datetime import datetime
-import os
+from config import camera_settings
+from display import FrameRenderer
+from storage import default_store
 
 
-saved_plate_dir = r'D:\oman_car_plates\saved_plates'
+plate_store = default_store()
 
 
 root = tk.Tk()
@@ -15,35 +15,23 @@ root.geometry("1200x800")
 root.configure(bg="#1E201E")
 
 
-cap = cv2.VideoCapture(0)
+cap = cv2.VideoCapture(camera_settings()["source"])
 
 def show_frame():
     ret, frame = cap.read()
     if ret:
-      
-        cv2image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        img_pil = Image.fromarray(cv2image)
-        img_tk = ImageTk.PhotoImage(image=img_pil)
-        video_label.config(image=img_tk)
-        video_label.image = img_tk
+        video_renderer.render(frame)
         
     root.after(10, show_frame)
 
 def capture_image():
     ret, frame = cap.read()
     if ret:
-       
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        img_filename = os.path.join(saved_plate_dir, f"capture_{timestamp}.png")
-       
-        cv2.imwrite(img_filename, frame)
-       
-        messagebox.showinfo("Capture", f"Image saved as {img_filename}")
+        # Captures go through the store like plate crops, so they are sharded and indexed
+        entry = plate_store.save(frame, camera_id="capture")
+        messagebox.showinfo("Capture", f"Image saved as {plate_store.full_path(entry['path'])}")
         
-        img_pil = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-        img_tk = ImageTk.PhotoImage(image=img_pil)
-        captured_image_label.config(image=img_tk)
-        captured_image_label.image = img_tk
+        captured_renderer.render(frame)
 
 
 video_label = tk.Label(root)
@@ -52,6 +40,10 @@ video_label.grid(row=0, column=0, columnspan=2, padx=10, pady=10, sticky="nsew")
 captured_image_label = tk.Label(root)
 captured_image_label.grid(row=1, column=0, columnspan=2, padx=10, pady=10, sticky="nsew")
 
+# Both labels keep one PhotoImage that is updated in place
+video_renderer = FrameRenderer(video_label)
+captured_renderer = FrameRenderer(captured_image_label)
+
 
 capture_button = tk.Button(root, text="Capture Image", command=capture_image, bg="#A0937D", fg="black", font=("Courier New", 12, "bold"), relief="raised", borderwidth=2)
 capture_button.grid(row=2, column=0, columnspan=2, padx=10, pady=5, sticky="ew")
@@ -63,3 +55,4 @@ root.protocol("WM_DELETE_WINDOW", lambda: (cap.release(), root.destroy()))
 
 
 root.mainloop()
+plate_store.close()
@@ -0,0 +1,122 @@
+import copy
+import json
+import os
+
+# Settings for the gate. Any key can be overridden from a JSON file next to the
+# scripts (security_gate.json) or from the file named by SECURITY_GATE_CONFIG.
+CONFIG_PATH = os.environ.get("SECURITY_GATE_CONFIG", "security_gate.json")
+
+DEFAULTS = {
+    # One entry per camera / gate lane. source is a device index, an RTSP-style
+    # URL or a video file. roi is either [x1, y1, x2, y2] or a polygon
+    # [[x, y], ...] in frame pixels; roi_scale < 1 additionally downsamples the
+    # region for the vehicle model. Lower priority numbers are served first by
+    # the "priority" ingest policy, and max_fps caps inference per lane (0 = no cap).
+    "cameras": {
+        "default": {"source": 0, "roi": None, "roi_scale": 1.0, "priority": 0, "max_fps": 0},
+    },
+    # How lanes.py schedules frames of several cameras into the shared pipeline:
+    # policy is "round_robin" or "priority"; max_batch frames go through one
+    # detect_batch call.
+    "ingest": {
+        "policy": "round_robin",
+        "max_batch": 4,
+    },
+    # Plate crops are written in the background under directory. format is png, jpeg or webp;
+    # quality applies to jpeg/webp. policy is drop_oldest or block when the
+    # write queue is full. The saved-plates browser caches thumbnails of at most
+    # thumbnail_size in thumbnail_dir.
+    "storage": {
+        "directory": "saved_plates",
+        "format": "png",
+        "png_compression": 3,
+        "quality": 90,
+        "queue_size": 64,
+        "policy": "drop_oldest",
+        "thumbnail_dir": "thumbnails",
+        "thumbnail_size": [160, 60],
+    },
+    # weights is the .pt file of each model. backend "ultralytics" runs it
+    # directly, "onnx" and "openvino" run the copy exported by backends.py (or
+    # the file in path). intra_op_threads/inter_op_threads tune ONNX Runtime.
+    "models": {
+        "car": {"weights": r"D:\oman_car_plates\MODELS\vehicle_detection.pt", "backend": "ultralytics"},
+        "plate": {"weights": r"D:\oman_car_plates\MODELS\licensePlate.pt", "backend": "ultralytics"},
+        "char": {"weights": r"D:\oman_car_plates\MODELS\best(2).pt", "backend": "ultralytics"},
+    },
+    # Shared inference server (server.py). When enabled the GUIs send frames to
+    # it instead of loading their own models. An empty address picks a Unix
+    # socket in a directory only this user can open, or a named pipe on Windows.
+    # Requests are unpickled by the server, so authkey must be a secret: when
+    # empty, a random key is generated once into authkey_file (mode 0600, by
+    # default next to the socket) and shared by server and clients. Cameras of
+    # the lanes and GUIs decode into shared-memory rings of ring_slots frames,
+    # which the server reads in place.
+    "server": {
+        "enabled": False,
+        "address": "",
+        "authkey": "",
+        "authkey_file": "",
+        "max_batch": 8,
+        "max_wait_ms": 10,
+        "ring_slots": 8,
+    },
+    # Live preview of the GUIs. Frames are redrawn at preview_fps whatever the
+    # inference rate (capped per camera by max_fps); the latest detection boxes
+    # are overlaid for overlay_max_age_ms and moved along their track for at
+    # most max_extrapolation_ms. gui_camera names the camera the GUIs open; empty
+    # means the first one in "cameras".
+    "display": {
+        "gui_camera": "",
+        "preview_fps": 30,
+        "overlay_max_age_ms": 1000,
+        "max_extrapolation_ms": 500,
+    },
+    # Owner records live in SQLite; csv_dir holds the old per-day CSV files that
+    # are imported once.
+    "registry": {
+        "path": "plates.db",
+        "csv_dir": "csv_files",
+    },
+}
+
+
+def _merge(base, override):
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            _merge(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+
+def load_config(path=CONFIG_PATH):
+    config = copy.deepcopy(DEFAULTS)
+    if path and os.path.exists(path):
+        with open(path, 'r') as config_file:
+            override = json.load(config_file)
+        # Configured cameras replace the built-in "default" one instead of being
+        # added to it; camera_settings() fills in the per-camera defaults
+        if "cameras" in override:
+            config["cameras"] = override.pop("cameras")
+        _merge(config, override)
+    return config
+
+
+settings = load_config()
+
+
+# Name of the camera the GUIs open
+def gui_camera_name():
+    return settings["display"].get("gui_camera") or next(iter(settings["cameras"]), "default")
+
+
+# Settings of a configured camera over the per-camera defaults; the GUI camera
+# when no name is given. Raises ValueError for a camera that is not configured,
+# rather than silently opening webcam 0 without its region of interest.
+def camera_settings(name=None):
+    name = name or gui_camera_name()
+    if name not in settings["cameras"]:
+        raise ValueError(f"Unknown camera {name!r}; configured cameras: {', '.join(settings['cameras'])}")
+    camera = copy.deepcopy(DEFAULTS["cameras"]["default"])
+    return _merge(camera, settings["cameras"][name])
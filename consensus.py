@@ -0,0 +1,70 @@
+from collections import defaultdict, deque
+
+from plate_text import PlateRead
+
+
+# Sliding-window vote over the plate reads of one track. Reads are grouped by
+# their number of labels (the count with the most confidence wins), then every
+# position votes for its label weighted by the character confidence. Labels of
+# the character model may be longer than one letter, so votes use the labels of
+# read.characters rather than positions in the joined text. Consensus is reached
+# when enough reads agree and every position's winning label holds at least
+# threshold of that position's weight.
+class PlateVoter:
+    def __init__(self, window=10, threshold=0.7, min_reads=3):
+        self.window = window
+        self.threshold = threshold
+        self.min_reads = min_reads
+        self.reads = deque(maxlen=window)
+        self.result = None
+
+    def add(self, read):
+        if read is not None and read.text:
+            self.reads.append(read)
+        return self.consensus()
+
+    # Returns the agreed PlateRead (confidences are the per-position vote
+    # shares) or None while the reads still disagree.
+    def consensus(self):
+        if self.result is not None:
+            return self.result
+        if len(self.reads) < self.min_reads:
+            return None
+
+        labelled = [(read, labels) for read, labels in ((read, _labels(read)) for read in self.reads)
+                    if labels is not None]
+        if len(labelled) < self.min_reads:
+            return None
+        length_weight = defaultdict(float)
+        for read, labels in labelled:
+            length_weight[len(labels)] += sum(read.confidences) / len(read.confidences)
+        length = max(length_weight, key=length_weight.get)
+        voters = [(read, labels) for read, labels in labelled if len(labels) == length]
+        if len(voters) < self.min_reads:
+            return None
+
+        text = []
+        shares = []
+        for position in range(length):
+            votes = defaultdict(float)
+            for read, labels in voters:
+                votes[labels[position]] += read.confidences[position]
+            label = max(votes, key=votes.get)
+            text.append(label)
+            shares.append(votes[label] / sum(votes.values()))
+        if min(shares) < self.threshold:
+            return None
+
+        latest = next((read for read, labels in reversed(voters) if list(labels) == text), voters[-1][0])
+        self.result = PlateRead("".join(text), tuple(shares), latest.characters)
+        return self.result
+
+
+# One label per confidence: the labels of the read's characters, or the letters of
+# its text for reads without characters. None when they do not line up, so the
+# read is left out of the vote.
+def _labels(read):
+    labels = tuple(char[4] for char in read.characters) if read.characters else tuple(read.text)
+    if not labels or len(labels) != len(read.confidences):
+        return None
+    return labels
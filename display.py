@@ -0,0 +1,162 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+from config import settings
+
+
+# Draws BGR frames into a Tk label without per-frame allocations. The target
+# size is cached until the label is resized, frames are resized with OpenCV
+# (INTER_AREA when shrinking) into a preallocated buffer, and one PhotoImage is
+# reused and updated in place with paste().
+class FrameRenderer:
+    def __init__(self, label, fixed_size=None):
+        self.label = label
+        self.fixed_size = fixed_size
+        self.area = None
+        self.size = None
+        self.resized = None
+        self.rgb = None
+        self.photo = None
+        self.shown = False
+        label.bind("<Configure>", self._on_configure, add="+")
+
+    def _on_configure(self, event):
+        self.area = None
+
+    # Space inside the label's border and highlight ring; falls back to the frame
+    # size until the label has been laid out
+    def _target_area(self, frame):
+        if self.fixed_size is not None:
+            return self.fixed_size
+        if self.area is None:
+            border = 2 * (int(float(self.label.cget("borderwidth"))) + int(float(self.label.cget("highlightthickness"))))
+            width, height = self.label.winfo_width() - border, self.label.winfo_height() - border
+            if width > 1 and height > 1:
+                self.area = (width, height)
+            else:
+                return frame.shape[1], frame.shape[0]
+        return self.area
+
+    def _fit(self, frame):
+        area_w, area_h = self._target_area(frame)
+        height, width = frame.shape[:2]
+        scale = min(area_w / width, area_h / height)
+        return max(1, int(width * scale)), max(1, int(height * scale))
+
+    # overlay, if given, is drawn on the resized copy so the caller's frame (e.g.
+    # a camera's latest frame) is never modified
+    def render(self, frame, overlay=None):
+        if frame is None or frame.size == 0:
+            return
+        size = self._fit(frame)
+        if size != self.size:
+            self.size = size
+            self.resized = np.empty((size[1], size[0], 3), dtype=np.uint8)
+            self.rgb = np.empty_like(self.resized)
+            self.photo = ImageTk.PhotoImage("RGB", size)
+            self.shown = False
+
+        if (frame.shape[1], frame.shape[0]) == size:
+            source = frame
+        else:
+            shrink = size[0] < frame.shape[1]
+            cv2.resize(frame, size, dst=self.resized, interpolation=cv2.INTER_AREA if shrink else cv2.INTER_LINEAR)
+            source = self.resized
+        if overlay is not None:
+            if source is frame:
+                np.copyto(self.resized, frame)
+                source = self.resized
+            overlay.draw(source, size[0] / frame.shape[1])
+        cv2.cvtColor(source, cv2.COLOR_BGR2RGB, dst=self.rgb)
+        self.photo.paste(Image.fromarray(self.rgb))
+
+        if not self.shown:
+            self.label.config(image=self.photo)
+            self.label.image = self.photo
+            self.shown = True
+
+    def clear(self):
+        self.label.config(image='')
+        self.shown = False
+
+
+# Latest detections of a live stream, drawn over frames newer than the one they
+# came from. Inference threads call update() with the capture time of their
+# frame; the display loop calls draw() on every preview frame. Boxes with a
+# track id move along with the velocity seen between the last two updates of
+# that track, for at most max_extrapolation seconds; everything disappears once
+# it is older than max_age seconds.
+class DetectionOverlay:
+    def __init__(self, max_age=1.0, max_extrapolation=0.5):
+        self.max_age = max_age
+        self.max_extrapolation = max_extrapolation
+        self.timestamp = None
+        self.cars = []
+        self.plates = []
+        self.motion = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, display=None):
+        display = display or settings["display"]
+        return cls(display["overlay_max_age_ms"] / 1000.0, display["max_extrapolation_ms"] / 1000.0)
+
+    # car_boxes are (x1, y1, x2, y2) boxes or backends.Detections rows, track_ids
+    # gives one id (or None) per car, plate_boxes are plain boxes of that frame
+    def update(self, car_boxes, track_ids=None, plate_boxes=(), timestamp=None):
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        boxes = [_box(box) for box in car_boxes]
+        track_ids = track_ids or [None] * len(boxes)
+        with self._lock:
+            motion = {}
+            for box, track_id in zip(boxes, track_ids):
+                if track_id is None:
+                    continue
+                velocity = np.zeros(4)
+                if track_id in self.motion:
+                    last_box, last_time, _ = self.motion[track_id]
+                    if timestamp > last_time:
+                        velocity = (box - last_box) / (timestamp - last_time)
+                motion[track_id] = (box, timestamp, velocity)
+            self.motion = motion
+            self.cars = list(zip(boxes, track_ids))
+            self.plates = [_box(box) for box in plate_boxes]
+            self.timestamp = timestamp
+
+    def clear(self):
+        with self._lock:
+            self.timestamp = None
+            self.cars = []
+            self.plates = []
+            self.motion = {}
+
+    # Draw onto image (BGR) whose pixels are scale times the frame coordinates
+    def draw(self, image, scale=1.0, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self.timestamp is None or now - self.timestamp > self.max_age:
+                return image
+            elapsed = min(max(now - self.timestamp, 0.0), self.max_extrapolation)
+            cars = [(box + self.motion[track_id][2] * elapsed if track_id in self.motion else box, track_id)
+                    for box, track_id in self.cars]
+            plates = list(self.plates)
+
+        for box, track_id in cars:
+            x1, y1, x2, y2 = (box * scale).astype(int)
+            cv2.rectangle(image, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            if track_id is not None:
+                cv2.putText(image, f"#{track_id}", (x1, max(y1 - 5, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+        for box in plates:
+            x1, y1, x2, y2 = (box * scale).astype(int)
+            cv2.rectangle(image, (x1, y1), (x2, y2), (0, 0, 255), 2)
+        return image
+
+
+def _box(box):
+    if hasattr(box, 'xyxy'):
+        return np.asarray(box.xyxy[0][:4], dtype=np.float64)
+    return np.asarray(box[:4], dtype=np.float64)
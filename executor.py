@@ -0,0 +1,136 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+_STOP = object()
+
+
+# Runs the car -> plate -> char cascade of a PipelineModel as three workers joined by
+# bounded queues, so vehicle detection of frame N+1 overlaps the plate and character
+# stages of frame N. PipelineModel.detect stays the synchronous entry point; use
+# submit() here when frames arrive as a stream (batch_cli.py --pipelined does).
+# Results have the shape of PipelineModel.detect, or of read_batch (one PlateRead
+# per plate) with reads=True.
+class PipelinedExecutor:
+    def __init__(self, pipeline, queue_size=4, max_batch=4, reads=False):
+        self.pipeline = pipeline
+        self.max_batch = max_batch
+        self.reads = reads
+        self.car_queue = queue.Queue(maxsize=queue_size)
+        self.plate_queue = queue.Queue(maxsize=queue_size)
+        self.char_queue = queue.Queue(maxsize=queue_size)
+        self.stage_time = {"car": 0.0, "plate": 0.0, "char": 0.0}
+        self.completed = 0
+        self.peak_depth = {"car": 0, "plate": 0, "char": 0}
+        self.started_at = None
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return self
+        self.started_at = time.monotonic()
+        stages = [
+            ("car", self.car_queue, self.plate_queue, self._run_cars),
+            ("plate", self.plate_queue, self.char_queue, self._run_plates),
+            ("char", self.char_queue, None, self._run_characters),
+        ]
+        for name, in_queue, out_queue, run in stages:
+            thread = threading.Thread(target=self._worker, args=(name, in_queue, out_queue, run),
+                                      name=f"pipeline-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    # Queue a frame for detection, optionally with a roi.RegionOfInterest. Blocks
+    # when the vehicle stage is full, which applies backpressure to the caller
+    # instead of growing memory.
+    def submit(self, frame, roi=None):
+        future = Future()
+        self.car_queue.put({"frame": frame, "roi": roi, "future": future})
+        with self._lock:
+            for name, depth in self._depths().items():
+                self.peak_depth[name] = max(self.peak_depth[name], depth)
+        return future
+
+    def _depths(self):
+        return {"car": self.car_queue.qsize(), "plate": self.plate_queue.qsize(), "char": self.char_queue.qsize()}
+
+    def stop(self):
+        if not self._threads:
+            return
+        self.car_queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def stats(self):
+        with self._lock:
+            elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+            return {
+                "completed": self.completed,
+                "throughput_fps": self.completed / elapsed if elapsed > 0 else 0.0,
+                "queue_depth": self._depths(),
+                "peak_queue_depth": dict(self.peak_depth),
+                "stage_seconds": dict(self.stage_time),
+            }
+
+    # Take one item and whatever else is already waiting (up to max_batch) so a
+    # stage that falls behind catches up with a larger batch.
+    def _take(self, in_queue):
+        items = [in_queue.get()]
+        while len(items) < self.max_batch and items[-1] is not _STOP:
+            try:
+                items.append(in_queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _worker(self, name, in_queue, out_queue, run):
+        while True:
+            items = self._take(in_queue)
+            stop = items[-1] is _STOP
+            if stop:
+                items.pop()
+            if items:
+                start = time.monotonic()
+                try:
+                    run(items)
+                except Exception as exc:
+                    for item in items:
+                        if not item["future"].done():
+                            item["future"].set_exception(exc)
+                    items = []
+                with self._lock:
+                    self.stage_time[name] += time.monotonic() - start
+                if out_queue is not None:
+                    for item in items:
+                        out_queue.put(item)
+            if stop:
+                if out_queue is not None:
+                    out_queue.put(_STOP)
+                return
+
+    def _run_cars(self, items):
+        car_boxes_list = self.pipeline._detect_cars([item["frame"] for item in items],
+                                                    [item["roi"] for item in items])
+        for item, car_boxes in zip(items, car_boxes_list):
+            item["car_boxes"] = car_boxes
+
+    def _run_plates(self, items):
+        plates_list = self.pipeline._detect_plates([item["frame"] for item in items],
+                                                   [item["car_boxes"] for item in items])
+        for item, plates in zip(items, plates_list):
+            item["plates"] = plates
+
+    def _run_characters(self, items):
+        plates_list = [item["plates"] for item in items]
+        if self.reads:
+            results = self.pipeline._read_plates(plates_list)
+        else:
+            results = self.pipeline._detect_characters(plates_list)
+        for item, result in zip(items, results):
+            item["future"].set_result((item["car_boxes"], item["plates"], result))
+        with self._lock:
+            self.completed += len(items)
@@ -0,0 +1,164 @@
+import argparse
+import sys
+import threading
+import time
+
+from camera import LatestFrameCapture
+from config import camera_settings, settings
+from roi import RegionOfInterest
+
+
+# One camera of the gate with its capture thread and scheduling state. With
+# ring_slots the capture decodes straight into a shared-memory ring for the
+# inference server.
+class Lane:
+    def __init__(self, name, camera, ring_slots=0):
+        self.name = name
+        self.priority = camera.get("priority", 0)
+        self.max_fps = camera.get("max_fps", 0)
+        self.roi = RegionOfInterest.from_config(camera)
+        self.capture = LatestFrameCapture(camera["source"], ring_slots=ring_slots)
+        self.last_scheduled = 0.0
+        self.scheduled = 0
+        self.errors = 0
+
+    # A lane may be scheduled once its FPS cap allows and a new frame is waiting
+    def ready(self, now):
+        if self.max_fps and now - self.last_scheduled < 1.0 / self.max_fps:
+            return False
+        return self.capture.frame_id > self.capture.read_id
+
+
+# Ingests several cameras at once, each on its own capture thread, and feeds
+# their freshest frames into one shared pipeline (a PipelineModel or a
+# server.InferenceClient). Every round takes up to max_batch ready lanes, in
+# round-robin order or by priority (e.g. the entry lane first), and runs them
+# through a single detect_batch call. With the inference server, each lane's
+# capture decodes into a shared-memory ring and only slot numbers are sent,
+# instead of pickling the frames over the connection. on_result(lane, frame, result) is called on the scheduler
+# thread for every processed frame. A batch that fails (a model exception or an
+# unreachable server) is logged and counted against its lanes, and scheduling
+# goes on with the next frames.
+class MultiLaneIngest:
+    def __init__(self, pipeline, camera_names=None, policy=None, max_batch=None, on_result=None):
+        ingest = settings["ingest"]
+        self.pipeline = pipeline
+        self.camera_names = camera_names or list(settings["cameras"])
+        self.policy = policy or ingest["policy"]
+        if self.policy not in ("round_robin", "priority"):
+            raise ValueError(f"Unknown ingest policy: {self.policy}")
+        self.max_batch = max_batch or ingest["max_batch"]
+        self.on_result = on_result
+        self.lanes = []
+        self.batches = 0
+        self._cursor = 0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        ring_slots = settings["server"]["ring_slots"] if hasattr(self.pipeline, "detect_shared_batch") else 0
+        self.lanes = [Lane(name, camera_settings(name), ring_slots) for name in self.camera_names]
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="lane-scheduler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+        for lane in self.lanes:
+            lane.capture.release()
+
+    def _pick(self, now):
+        ready = [lane for lane in self.lanes if lane.ready(now)]
+        if self.policy == "priority":
+            ready.sort(key=lambda lane: (lane.priority, lane.last_scheduled))
+        else:
+            count = len(self.lanes)
+            order = {id(lane): (i - self._cursor) % count for i, lane in enumerate(self.lanes)}
+            ready.sort(key=lambda lane: order[id(lane)])
+            if ready:
+                self._cursor = (self.lanes.index(ready[min(len(ready), self.max_batch) - 1]) + 1) % count
+        return ready[:self.max_batch]
+
+    def _run(self):
+        while self._running:
+            now = time.monotonic()
+            batch = []
+            for lane in self._pick(now):
+                item = lane.capture.read_shared(timeout=0)
+                if item is not None:
+                    lane.last_scheduled = now
+                    lane.scheduled += 1
+                    batch.append((lane, item[1], item[2]))
+            if not batch:
+                if self.lanes and all(lane.capture.ended for lane in self.lanes):
+                    break
+                time.sleep(0.005)
+                continue
+
+            try:
+                if all(shared is not None for _, _, shared in batch):
+                    results = self.pipeline.detect_shared_batch([shared + (lane.roi,) for lane, _, shared in batch])
+                else:
+                    results = self.pipeline.detect_batch([frame for _, frame, _ in batch], [lane.roi for lane, _, _ in batch])
+            except Exception as exc:
+                for lane, _, _ in batch:
+                    lane.errors += 1
+                print(f"Detection failed for {', '.join(lane.name for lane, _, _ in batch)}: {exc}", file=sys.stderr, flush=True)
+                time.sleep(0.5)
+                continue
+            self.batches += 1
+            if self.on_result is not None:
+                for (lane, frame, _), result in zip(batch, results):
+                    self.on_result(lane, frame, result)
+
+    def stats(self):
+        return {
+            lane.name: dict(lane.capture.stats(), scheduled=lane.scheduled, errors=lane.errors, ended=lane.capture.ended)
+            for lane in self.lanes
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run detection on every configured camera lane.")
+    parser.add_argument("cameras", nargs="*", help="camera names from config (default: all)")
+    parser.add_argument("--policy", choices=["round_robin", "priority"])
+    parser.add_argument("--save-plates", action="store_true", help="save every plate crop to the plate store")
+    args = parser.parse_args()
+    for name in args.cameras:
+        try:
+            camera_settings(name)
+        except ValueError as exc:
+            parser.error(str(exc))
+
+    from server import create_pipeline
+    from storage import default_store
+    pipeline = create_pipeline(lazy=False)
+    store = default_store() if args.save_plates else None
+
+    def on_result(lane, frame, result):
+        _, plates, characters = result
+        text = "".join(char[4] for char in characters)
+        if text:
+            print(f"{lane.name}: {text}", flush=True)
+        if store is not None:
+            for plate in plates:
+                store.save(plate[4], camera_id=lane.name)
+
+    ingest = MultiLaneIngest(pipeline, args.cameras or None, args.policy, on_result=on_result).start()
+    try:
+        while any(not lane.capture.ended for lane in ingest.lanes):
+            time.sleep(5)
+            print(ingest.stats(), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ingest.stop()
+        if store is not None:
+            store.close()
+
+
+if __name__ == "__main__":
+    main()
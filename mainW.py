@@ -2,157 +2,239 @@ import tkinter as tk
 from tkinter import filedialog, messagebox
 from PIL import Image, ImageTk
 import cv2
-import os
-from datetime import datetime
-from model import PipelineModel
+from server import create_pipeline
+from motion import MotionGate
+from roi import RegionOfInterest
+from config import camera_settings, settings
+from storage import default_store
+from camera import LatestFrameCapture
+from display import FrameRenderer, DetectionOverlay
+from owners import OwnerIndex
 import threading
 import queue
+import time
 
 
-pipeline = PipelineModel(
-    car_model_path=r'D:\oman_car_plates\MODELS\vehicle_detection.pt',
-    plate_model_path=r'D:\oman_car_plates\MODELS\licensePlate.pt',
-    char_model_path=r'D:\oman_car_plates\MODELS\best(2).pt'
-)
+# Model paths come from config.py; the models load (or the shared inference
+# server is connected) in the background once the window is up (see
+# check_models_loaded)
+pipeline = create_pipeline(lazy=True)
+# With the inference server, live frames are decoded into a shared-memory ring
+# and only their slot is sent, instead of pickling each frame per request
+ring_slots = settings["server"]["ring_slots"] if hasattr(pipeline, "read_shared") else 0
 
 cap = None
 file_path = None
 is_video = False
 show_plate = True
-frame_skip = 2  # Process every 2nd frame
+frame_skip = 2  # Process every 2nd frame while the scene is active
 frame_count = 0
-saved_plate_dir = "saved_plates"
-os.makedirs(saved_plate_dir, exist_ok=True)
+motion_gate = MotionGate(active_skip=frame_skip)
+gui_camera = camera_settings()
+camera_roi = RegionOfInterest.from_config(gui_camera)
+plate_store = default_store()
+owner_index = OwnerIndex()
 
 plate_saved = False
-frame_queue = queue.Queue()
-
-# Function to resize the image to fit the frame
-def resize_image_to_fit(frame_width, frame_height, image):
-    img_width, img_height = image.size
-    scale_width = frame_width / img_width
-    scale_height = frame_height / img_height
-    scale = min(scale_width, scale_height)
-    
-    new_width = int(img_width * scale)
-    new_height = int(img_height * scale)
-    
-    return image.resize((new_width, new_height), Image.ANTIALIAS)
-
-# Function to process the frame
-def process_frame(frame):
+# Holds at most one frame: a newer frame replaces one that has not been
+# processed yet, so the UI never works through a stale backlog
+frame_queue = queue.Queue(maxsize=1)
+frames_dropped = 0
+# Inference runs on worker threads; results reach the Tk thread only through
+# result_queue. generation changes whenever the display is cleared so results of
+# a previous run are ignored.
+result_queue = queue.Queue()
+generation = 0
+inference_workers = 1
+# The display (and the live preview) refreshes at preview_fps; inference takes
+# at most the camera's max_fps (0 = as fast as the models go). Detections of the
+# live camera are drawn over its newest frames by overlay.
+display_interval_ms = max(1, int(1000 / settings["display"]["preview_fps"]))
+inference_fps = gui_camera["max_fps"]
+overlay = DetectionOverlay.from_config()
+live_camera = None  # Camera of the open capture window, owned by that window
+
+# Function to process the frame. Live frames only update the overlay (img_bgr is
+# None) since the preview draws the camera's newest frame itself; stills come
+# back annotated. shared is the (ring, slot, seq) of a live frame in the
+# camera's ring, which the inference server then reads in place.
+def process_frame(frame, captured=None, shared=None):
     global plate_saved
-    car_boxes, plates, characters = pipeline.detect(frame)
-    img_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    
-    for box in car_boxes:
-        x1, y1, x2, y2 = map(int, box.xyxy[0])
-        cv2.rectangle(img_rgb, (x1, y1), (x2, y2), (0, 255, 0), 2)
+    # The camera region of interest only applies to video, not to uploaded stills
+    if shared is not None:
+        car_boxes, plates, reads = pipeline.read_shared(*shared, roi=camera_roi)
+    else:
+        car_boxes, plates, reads = pipeline.read(frame, roi=camera_roi if is_video else None)
+    motion_gate.set_vehicles_present(len(car_boxes) > 0)
     
     plate_img = None
+    plate_boxes = []
     if plates and not plate_saved:
-        px1, py1, px2, py2, plate_crop = plates[0]
-        cv2.rectangle(img_rgb, (px1, py1), (px2, py2), (255, 0, 0), 2)
-        plate_img = cv2.cvtColor(plate_crop, cv2.COLOR_BGR2RGB)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        plate_filename = os.path.join(saved_plate_dir, f"plate_{timestamp}.png")
-        cv2.imwrite(plate_filename, cv2.cvtColor(plate_crop, cv2.COLOR_RGB2BGR))
+        plate_boxes.append(plates[0][:4])
+        plate_img = plates[0][4]
+        plate_store.save(plate_img)
         plate_saved = True
 
-    img_pil = Image.fromarray(img_rgb)
-    return img_pil, plate_img, characters
+    if is_video:
+        overlay.update(car_boxes, plate_boxes=plate_boxes, timestamp=captured)
+        return None, plate_img, reads
 
-# Function to update the results
-def update_results(characters):
-    result_text = "Detection Results:\n"
-    filtered_labels = []
+    # Annotate a BGR copy; the display renderer converts it once for Tk
+    img_bgr = frame.copy()
+    for box in car_boxes:
+        x1, y1, x2, y2 = map(int, box.xyxy[0])
+        cv2.rectangle(img_bgr, (x1, y1), (x2, y2), (0, 255, 0), 2)
+    for px1, py1, px2, py2 in plate_boxes:
+        cv2.rectangle(img_bgr, (px1, py1), (px2, py2), (0, 0, 255), 2)
+
+    return img_bgr, plate_img, reads
+
+# Function to build the result text, one line per plate with its owner; each
+# plate's text is looked up on its own. Runs on the inference workers.
+def format_results(reads):
+    result_text = "Detection Results:"
+    found = False
     
     valid_labels = set(map(str, range(10)))
     valid_labels.update(chr(c) for c in range(65, 91))
     
-    if characters:
-        for _, _, _, _, label in characters:
-            if label in valid_labels:
-                filtered_labels.append(label)
+    for read in reads:
+        filtered_labels = [label for label in read.text if label in valid_labels]
+        if not filtered_labels:
+            continue
+        found = True
+        result_text += "\n" + " ".join(filtered_labels)
+        match = owner_index.lookup("".join(filtered_labels))
+        if match:
+            record, distance = match
+            result_text += f"  Owner: {record['name']}" + (f" (~{distance})" if distance else "")
     
-    if filtered_labels:
-        result_text += " ".join(filtered_labels)
-    else:
-        result_text += "No valid characters detected."
+    if not found:
+        result_text += "\nNo valid characters detected."
     
-    result_label.config(text=result_text)
-
-# Thread function to process the frame
-def frame_processing_thread():
+    return result_text
+
+# Function to send a status line to the UI from any thread
+def post_status(text, run_generation=None):
+    result_queue.put(("status", generation if run_generation is None else run_generation, text))
+
+# Function to hand the newest frame to the inference workers, dropping one still waiting
+def put_latest_frame(frame, captured=None, shared=None, run_generation=None):
+    global frames_dropped
+    try:
+        frame_queue.get_nowait()
+        frames_dropped += 1
+    except queue.Empty:
+        pass
+    frame_queue.put((generation if run_generation is None else run_generation, frame, captured, shared))
+
+# Thread function to read frames for the inference workers. It belongs to one
+# run and exits as soon as generation changes, e.g. when detection is restarted
+# on the same camera.
+def frame_processing_thread(run_generation):
     global cap, file_path, is_video, show_plate, frame_count
     
-    while True:
-        if is_video:
-            ret, frame = cap.read()
-            if not ret:
-                cap.release()
-                is_video = False
-                result_label.config(text="Video ended or failed to capture frame")
+    if is_video:
+        # cap is a LatestFrameCapture, so read() always returns the freshest frame
+        source = cap
+        min_interval = 1.0 / inference_fps if inference_fps else 0
+        while generation == run_generation:
+            started = time.monotonic()
+            item = source.read_shared(timeout=1.0)
+            if generation != run_generation:
                 break
+            if item is None:
+                if source.ended:
+                    is_video = False
+                    post_status("Video ended or failed to capture frame", run_generation)
+                    break
+                continue
             
-            if frame_count % frame_skip == 0:
-                frame_queue.put(frame)
+            _, frame, shared = item
+            if motion_gate.should_process(frame):
+                put_latest_frame(frame, time.monotonic(), shared, run_generation)
             
             frame_count += 1
-        elif file_path:
-            frame = cv2.imread(file_path)
-            if frame is not None:
-                frame_queue.put(frame)
-            else:
-                result_label.config(text="Failed to load image")
-        
-        cv2.waitKey(10)
+            delay = min_interval - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+    elif file_path:
+        frame = cv2.imread(file_path)
+        if frame is not None:
+            put_latest_frame(frame, run_generation=run_generation)
+        else:
+            post_status("Failed to load image", run_generation)
 
-# Function to process the queue and update the UI
-def process_queue():
-    while not frame_queue.empty():
-        frame = frame_queue.get()
-        img_pil, plate_img, characters = process_frame(frame)
-        
-        img_width, img_height = video_frame_left.winfo_width(), video_frame_left.winfo_height()
-        img_resized = resize_image_to_fit(img_width, img_height, img_pil)
-        img_tk = ImageTk.PhotoImage(img_resized)
-        video_frame_left.config(image=img_tk)
-        video_frame_left.image = img_tk
+# Thread function of the inference workers. They never touch Tk widgets; results
+# go to result_queue and are applied on the Tk thread by apply_results.
+def inference_worker():
+    while True:
+        frame_generation, frame, captured, shared = frame_queue.get()
+        if frame_generation != generation:
+            continue
+        try:
+            img_bgr, plate_img, reads = process_frame(frame, captured, shared)
+            result_queue.put(("frame", frame_generation, (img_bgr, plate_img, format_results(reads))))
+        except Exception as exc:
+            post_status(f"Detection failed: {exc}")
+
+# Function to apply worker results on the Tk thread. Everything that arrived
+# since the last tick is drained and only the newest frame result is drawn, in
+# one update of the widgets.
+def apply_results():
+    latest_frame = None
+    latest_status = None
+    while True:
+        try:
+            kind, result_generation, payload = result_queue.get_nowait()
+        except queue.Empty:
+            break
+        if result_generation != generation:
+            continue
+        if kind == "frame":
+            latest_frame = payload
+            latest_status = payload[2]
+        else:
+            latest_status = payload
+    
+    if latest_frame is not None:
+        img_bgr, plate_img, _ = latest_frame
+        if img_bgr is not None:
+            vehicle_renderer.render(img_bgr)
         
         if show_plate and plate_img is not None:
-            plate_img_pil = Image.fromarray(plate_img)
-            plate_img_width, plate_img_height = video_frame_right.winfo_width(), video_frame_right.winfo_height()
-            plate_img_resized = resize_image_to_fit(plate_img_width, plate_img_height, plate_img_pil)
-            plate_img_tk = ImageTk.PhotoImage(plate_img_resized)
-            video_frame_right.config(image=plate_img_tk)
-            video_frame_right.image = plate_img_tk
+            plate_renderer.render(plate_img)
         else:
-            video_frame_right.config(image='')
-        
-        update_results(characters)
+            plate_renderer.clear()
+    
+    if latest_status is not None:
+        result_label.config(text=latest_status)
     
-    root.update_idletasks()
-    root.after(100, process_queue)
+    root.after(display_interval_ms, apply_results)
+
+# Function to start the inference workers once at startup
+def start_inference_workers():
+    for _ in range(inference_workers):
+        threading.Thread(target=inference_worker, daemon=True).start()
 
 # Function to start frame processing
 def start_frame_processing():
-    global frame_queue
-    frame_queue.queue.clear()
-    threading.Thread(target=frame_processing_thread, daemon=True).start()
-    root.after(100, process_queue)
+    threading.Thread(target=frame_processing_thread, args=(generation,), daemon=True).start()
 
 # Function to clear previous data
 def clear_previous_data():
-    global cap, file_path, is_video, plate_saved
-    if cap:
+    global cap, file_path, is_video, plate_saved, generation
+    generation += 1
+    if cap and cap is not live_camera:
         cap.release()
-        cap = None
+    cap = None
     file_path = None
     is_video = False
     plate_saved = False
-    video_frame_left.config(image='')
-    video_frame_right.config(image='')
+    motion_gate.reset()
+    overlay.clear()
+    vehicle_renderer.clear()
+    plate_renderer.clear()
     result_label.config(text='')
     global frame_queue
     frame_queue.queue.clear()
@@ -170,34 +252,58 @@ def upload_image():
         start_frame_processing()
 
 def open_capture_window():
+    global live_camera
     capture_window = tk.Toplevel(root)
     capture_window.title("Capture")
     capture_window.geometry("800x600")
     
-    cap = cv2.VideoCapture(0)
+    # The camera is grabbed on its own thread; this window and detection both
+    # take its latest frame instead of reading the device themselves
+    camera = live_camera = LatestFrameCapture(gui_camera["source"], ring_slots=ring_slots)
     
     def show_frame():
-        ret, frame = cap.read()
-        if ret:
-            cv2image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            img_pil = Image.fromarray(cv2image)
-            img_tk = ImageTk.PhotoImage(image=img_pil)
-            video_frame_left.config(image=img_tk)
-            video_frame_left.image = img_tk
+        if not camera.running:
+            return
+        _, frame = camera.latest()
+        # Live frames are shown at preview rate; while detection runs on this
+        # camera its latest boxes are drawn on top
+        if frame is not None:
+            vehicle_renderer.render(frame, overlay if is_video and cap is camera else None)
             
-        capture_window.after(10, show_frame)
+        capture_window.after(display_interval_ms, show_frame)
     
     def capture_image():
-        ret, frame = cap.read()
-        if ret:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            img_filename = os.path.join(saved_plate_dir, f"capture_{timestamp}.png")
-            cv2.imwrite(img_filename, frame)
-            messagebox.showinfo("Capture", f"Image saved as {img_filename}")
+        _, frame = camera.latest()
+        if frame is not None:
+            # Captures go through the store like plate crops, so they are sharded and indexed
+            entry = plate_store.save(frame, camera_id="capture")
+            messagebox.showinfo("Capture", f"Image saved as {plate_store.full_path(entry['path'])}")
+    
+    def start_live_detection():
+        global cap, is_video, show_plate, frame_count
+        clear_previous_data()
+        cap = camera
+        is_video = True
+        show_plate = True
+        frame_count = 0
+        start_frame_processing()
+    
+    def close_capture_window():
+        global live_camera
+        # Ends the detection run on this camera, and with it its frame thread
+        if cap is camera:
+            clear_previous_data()
+        live_camera = None
+        camera.release()
+        capture_window.destroy()
     
     capture_button = tk.Button(capture_window, text="Capture Image", command=capture_image, bg="#A0937D", fg="black", font=("Courier New", 12, "bold"))
     capture_button.pack(side=tk.BOTTOM, pady=10)
     
+    detect_button = tk.Button(capture_window, text="Start Detection", command=start_live_detection, bg="#A0937D", fg="black", font=("Courier New", 12, "bold"))
+    detect_button.pack(side=tk.BOTTOM, pady=10)
+    
+    capture_window.protocol("WM_DELETE_WINDOW", close_capture_window)
     capture_window.after(10, show_frame)
 # Function to show saved plates
 def show_saved_plates():
@@ -207,11 +313,12 @@ def show_saved_plates():
 # Function to stop detection
 def stop_detection():
     global cap, is_video
-    if cap:
+    if cap and cap is not live_camera:
         cap.release()
-        cap = None
+    cap = None
     is_video = False
     clear_previous_data()
+    plate_store.writer.flush()
     result_label.config(text="Detection stopped.")
 
 # Tkinter 
@@ -238,6 +345,10 @@ video_frame_left.grid(row=1, column=0, rowspan=8, padx=8, pady=8, sticky="nsew")
 video_frame_right = tk.Label(root, text="PLATE", bg="#1E201E", fg="white", font=("Courier New", 16, "bold"),relief="groove", borderwidth=1, bd=2, highlightbackground="beige", highlightcolor="black", highlightthickness=4)
 video_frame_right.grid(row=1, column=1, rowspan=8, padx=8, pady=8, sticky="nsew")
 
+# Both panels reuse one PhotoImage each, resized with OpenCV on every update
+vehicle_renderer = FrameRenderer(video_frame_left)
+plate_renderer = FrameRenderer(video_frame_right)
+
 
 button_font = ("Courier New", 10, "bold") 
 button_padx = 10  
@@ -294,4 +405,23 @@ root.grid_columnconfigure(0, weight=1)
 root.grid_columnconfigure(1, weight=1)
 
 
+# Keep detection disabled until the models are loaded; loading and a warm-up
+# inference run off the UI thread so the window appears immediately
+def check_models_loaded():
+    if not pipeline.ready.is_set():
+        root.after(200, check_models_loaded)
+    elif pipeline.load_error is not None:
+        result_label.config(text=f"Failed to load models: {pipeline.load_error}")
+    else:
+        upload_image_button.config(state="normal")
+        result_label.config(text="MADE WITH LOVE  ❤️BY AMAL ALKRAIMEEN")
+
+upload_image_button.config(state="disabled")
+result_label.config(text="Loading models...")
+pipeline.load_async()
+root.after(200, check_models_loaded)
+start_inference_workers()
+root.after(display_interval_ms, apply_results)
+
 root.mainloop()
+plate_store.close()
@@ -1,41 +1,229 @@
-from ultralytics import YOLO
+import threading
+
+import numpy as np
+from backends import Detections, load_model
+from config import settings
+from plate_text import EMPTY_READ, decode_plates, characters_from_reads
+
+
+# Car boxes may be backends.Detections rows or plain (x1, y1, x2, y2) tuples
+def _xyxy(box):
+    if hasattr(box, 'xyxy'):
+        return tuple(map(int, box.xyxy[0]))
+    return tuple(map(int, box[:4]))
 
 class PipelineModel:
-    def __init__(self, car_model_path, plate_model_path, char_model_path):
-        self.car_model = YOLO(r'D:\oman_car_plates\MODELS\vehicle_detection.pt')
- 
-        self.plate_model = YOLO(r'D:\oman_car_plates\MODELS\licensePlate.pt')  
-        self.char_model = YOLO(r'D:\oman_car_plates\MODELS\best(2).pt') 
-
-    def detect(self, frame):
-        # Step 1: Detect cars
-        car_results = self.car_model.predict(frame)
-        car_boxes = car_results[0].boxes
-
-        plates = []
-        for car_box in car_boxes:
-            x1, y1, x2, y2 = map(int, car_box.xyxy[0])
-            car_crop = frame[y1:y2, x1:x2]
-
-            # Step 2: Detect plates within each car
-            plate_results = self.plate_model.predict(car_crop)
-            plate_boxes = plate_results[0].boxes
-
-            for plate_box in plate_boxes:
+    # Model paths default to the "weights" of each entry in config "models", and
+    # each model runs on the backend chosen there (ultralytics, onnx or openvino);
+    # see backends.py for exporting the .pt files. With lazy=True nothing is
+    # loaded until load() or load_async(); detection waits until ready is set.
+    def __init__(self, car_model_path=None, plate_model_path=None, char_model_path=None, backends=None, lazy=False):
+        self.backends = backends or settings["models"]
+        self.model_paths = {
+            "car": car_model_path or self.backends["car"]["weights"],
+            "plate": plate_model_path or self.backends["plate"]["weights"],
+            "char": char_model_path or self.backends["char"]["weights"],
+        }
+        self.car_model = self.plate_model = self.char_model = None
+        self.ready = threading.Event()
+        self._loaded = threading.Event()
+        self.load_error = None
+        self._load_lock = threading.Lock()
+        if not lazy:
+            self.load()
+
+    def load(self):
+        try:
+            self._load_models()
+        finally:
+            self.ready.set()
+
+    # Load the three models; ready is left to the caller, so load_async can keep
+    # detection waiting until the warm-up has finished as well
+    def _load_models(self):
+        with self._load_lock:
+            if self._loaded.is_set():
+                return
+            try:
+                self.car_model = load_model(self.model_paths["car"], self._spec("car"))
+                self.plate_model = load_model(self.model_paths["plate"], self._spec("plate"))
+                self.char_model = load_model(self.model_paths["char"], self._spec("char"))
+            except Exception as exc:
+                self.load_error = exc
+                raise
+            finally:
+                self._loaded.set()
+
+    def _spec(self, name):
+        spec = dict(self.backends[name])
+        spec.pop("weights", None)
+        return spec
+
+    # Run one inference per model on blank input so the first real frame does not
+    # pay for lazy initialisation inside the runtimes
+    def warm_up(self):
+        self._loaded.wait()
+        if self.load_error is not None:
+            raise RuntimeError(f"Models failed to load: {self.load_error}")
+        blank = np.zeros((640, 640, 3), dtype=np.uint8)
+        self.car_model.predict([blank])
+        self.plate_model.predict([blank[:320, :320]])
+        self.char_model.predict([blank[:64, :192]])
+
+    # Load and warm up on a background thread, e.g. while the GUI is already up.
+    # ready is only set once the warm-up has finished (or loading or warm-up
+    # failed, see load_error), so no detection runs on the models meanwhile.
+    # callback(error) runs on that thread when done; error is None on success.
+    def load_async(self, warm_up=True, callback=None):
+        def run():
+            error = None
+            try:
+                self._load_models()
+                if warm_up:
+                    self.warm_up()
+            except Exception as exc:
+                error = exc
+                self.load_error = self.load_error or exc
+            finally:
+                self.ready.set()
+            if callback is not None:
+                callback(error)
+
+        thread = threading.Thread(target=run, name="model-loader", daemon=True)
+        thread.start()
+        return thread
+
+    def _wait_ready(self):
+        self.ready.wait()
+        if self.load_error is not None:
+            raise RuntimeError(f"Models failed to load: {self.load_error}")
+
+    # Run one model (named by its attribute, which is only set once loaded) over a
+    # list of crops in a single call. Backends letterbox every image to the model
+    # size, so crops of different shapes share one batch.
+    def _predict_batch(self, model_name, images):
+        if not images:
+            return []
+        self._wait_ready()
+        return getattr(self, model_name).predict(images)
+
+    # Step 1: Detect cars in every frame with one call to the vehicle model. Frames
+    # with a region of interest are cropped first and their boxes mapped back; a
+    # region that misses the frame has no cars and is not sent to the model.
+    def _detect_cars(self, frames, rois=None):
+        rois = rois or [None] * len(frames)
+        images = []
+        offsets = []
+        for frame, roi in zip(frames, rois):
+            if roi is None:
+                images.append(frame)
+                offsets.append(None)
+            else:
+                image, offset = roi.crop(frame)
+                images.append(image)
+                offsets.append(offset)
+
+        results = iter(self._predict_batch('car_model', [image for image in images if image.size > 0]))
+        car_boxes_list = []
+        for image, roi, offset in zip(images, rois, offsets):
+            if image.size == 0:
+                car_boxes_list.append(Detections(np.zeros((0, 6), dtype=np.float32)))
+                continue
+            result = next(results)
+            if roi is not None:
+                data = result.data.copy()
+                data[:, :4] = roi.to_frame(data[:, :4], offset)
+                result = Detections(data)
+            car_boxes_list.append(result)
+        return car_boxes_list
+
+    # Step 2: Detect plates within all cars of all frames in one batch.
+    # Returns one list of (x1, y1, x2, y2, plate_crop) per frame.
+    def _detect_plates(self, frames, car_boxes_list):
+        owners = []
+        car_offsets = []
+        car_crops = []
+        for index, (frame, car_boxes) in enumerate(zip(frames, car_boxes_list)):
+            for car_box in car_boxes:
+                x1, y1, x2, y2 = _xyxy(car_box)
+                car_crop = frame[y1:y2, x1:x2]
+                if car_crop.size > 0:
+                    owners.append(index)
+                    car_offsets.append((x1, y1))
+                    car_crops.append(car_crop)
+
+        plates_list = [[] for _ in frames]
+        plate_results = self._predict_batch('plate_model', car_crops)
+        for index, (x1, y1), car_crop, plate_result in zip(owners, car_offsets, car_crops, plate_results):
+            for plate_box in plate_result:
                 px1, py1, px2, py2 = map(int, plate_box.xyxy[0])
                 plate_crop = car_crop[py1:py2, px1:px2]
-                plates.append((x1 + px1, y1 + py1, x1 + px2, y1 + py2, plate_crop))
+                plates_list[index].append((x1 + px1, y1 + py1, x1 + px2, y1 + py2, plate_crop))
+        return plates_list
+
+    # Step 3: Read characters within all plates of all frames in one batch. The raw
+    # detections of every plate are decoded together by plate_text.decode_plates.
+    # Returns one PlateRead per plate, aligned with plates_list.
+    def _read_plates(self, plates_list):
+        flat = [plate for plates in plates_list for plate in plates]
+        readable = [i for i, plate in enumerate(flat) if plate[4].size > 0]
+        char_results = self._predict_batch('char_model', [flat[i][4] for i in readable])
+
+        xyxy, cls, conf, plate_index = [], [], [], []
+        for i, char_result in zip(readable, char_results):
+            xyxy.append(char_result.xyxy)
+            cls.append(char_result.cls)
+            conf.append(char_result.conf)
+            plate_index.append(np.full(len(char_result), i, dtype=np.int64))
+
+        reads = [EMPTY_READ] * len(flat)
+        if xyxy:
+            offsets = [(plate[0], plate[1]) for plate in flat]
+            reads = decode_plates(np.concatenate(xyxy), np.concatenate(cls), np.concatenate(conf),
+                                  np.concatenate(plate_index), len(flat), self.char_model.names, offsets)
+
+        reads_list = []
+        for plates in plates_list:
+            reads_list.append(reads[:len(plates)])
+            reads = reads[len(plates):]
+        return reads_list
+
+    # Characters as (x1, y1, x2, y2, label) per frame, in reading order
+    def _detect_characters(self, plates_list):
+        return [characters_from_reads(reads) for reads in self._read_plates(plates_list)]
+
+    # Run the cascade over several frames (e.g. one per gate lane). Each stage is
+    # invoked once for the whole batch; results come back in input order. rois
+    # optionally gives a roi.RegionOfInterest (or None) per frame.
+    def detect_batch(self, frames, rois=None):
+        frames = list(frames)
+        car_boxes_list = self._detect_cars(frames, rois)
+        plates_list = self._detect_plates(frames, car_boxes_list)
+        characters_list = self._detect_characters(plates_list)
+        return list(zip(car_boxes_list, plates_list, characters_list))
+
+    # Like detect_batch, but with one plate_text.PlateRead per plate instead of
+    # the characters of all plates, e.g. to report the text of every plate box
+    def read_batch(self, frames, rois=None):
+        frames = list(frames)
+        car_boxes_list = self._detect_cars(frames, rois)
+        plates_list = self._detect_plates(frames, car_boxes_list)
+        return list(zip(car_boxes_list, plates_list, self._read_plates(plates_list)))
 
-        characters = []
-        for plate in plates:
-            px1, py1, px2, py2, plate_crop = plate
+    def detect_cars(self, frame, roi=None):
+        return self._detect_cars([frame], [roi])[0]
 
-            # Step 3: Detect characters within each plate
-            char_results = self.char_model.predict(plate_crop)
-            char_boxes = char_results[0].boxes
+    # Run the plate and character stages only for the given cars of a frame, e.g.
+    # the tracks that still need a read. Returns (plates, reads) per car, with one
+    # plate_text.PlateRead per plate.
+    def read_vehicles(self, frame, car_boxes):
+        car_boxes = list(car_boxes)
+        plates_list = self._detect_plates([frame] * len(car_boxes), [[box] for box in car_boxes])
+        return list(zip(plates_list, self._read_plates(plates_list)))
 
-            for char_box in char_boxes:
-                cx1, cy1, cx2, cy2 = map(int, char_box.xyxy[0])
-                characters.append((px1 + cx1, py1 + cy1, px1 + cx2, py1 + cy2))
+    def detect(self, frame, roi=None):
+        return self.detect_batch([frame], [roi])[0]
 
-        return car_boxes, plates, characters
\ No newline at end of file
+    # (car_boxes, plates, reads) of one frame, with one PlateRead per plate
+    def read(self, frame, roi=None):
+        return self.read_batch([frame], [roi])[0]
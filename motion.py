@@ -0,0 +1,63 @@
+import cv2
+
+
+# Cheap change detector that sits in front of PipelineModel.detect. Frames are
+# downscaled to a small grayscale image and compared with a running-average
+# background; the cascade only runs when enough pixels changed. While vehicles
+# are present the skip rate tightens to active_skip, and an idle scene is still
+# checked every idle_skip frames so slow arrivals are not missed.
+class MotionGate:
+    def __init__(self, width=160, pixel_threshold=25, area_threshold=0.01,
+                 active_skip=2, idle_skip=50, hold_frames=30, learning_rate=0.05):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.area_threshold = area_threshold
+        self.active_skip = active_skip
+        self.idle_skip = idle_skip
+        self.hold_frames = hold_frames
+        self.learning_rate = learning_rate
+        self.reset()
+
+    def reset(self):
+        self.background = None
+        self.frame_count = 0
+        self.hold = 0
+        self.vehicles = False
+        self.skipped = 0
+
+    def _small_gray(self, frame):
+        height, width = frame.shape[:2]
+        scale = self.width / float(width)
+        small = cv2.resize(frame, (self.width, max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    # Fraction of the downscaled frame that differs from the background
+    def motion_level(self, frame):
+        gray = self._small_gray(frame)
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray.astype("float32")
+            return 1.0
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        cv2.accumulateWeighted(gray, self.background, self.learning_rate)
+        changed = cv2.countNonZero(cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)[1])
+        return changed / float(diff.size)
+
+    def should_process(self, frame):
+        self.frame_count += 1
+        if self.motion_level(frame) >= self.area_threshold:
+            self.hold = self.hold_frames
+        elif self.hold > 0:
+            self.hold -= 1
+
+        skip = self.active_skip if (self.hold > 0 or self.vehicles) else self.idle_skip
+        if self.frame_count % max(1, skip) == 0:
+            return True
+        self.skipped += 1
+        return False
+
+    # Report the outcome of the last inference so the gate keeps the fast rate
+    # while a car is waiting at the barrier without moving.
+    def set_vehicles_present(self, present):
+        self.vehicles = bool(present)
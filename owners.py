@@ -0,0 +1,114 @@
+import threading
+
+from registry import default_registry
+
+
+# Plate text as the recognizer produces it: uppercase letters and digits only
+def normalize_plate(text):
+    return "".join(ch for ch in str(text).upper() if ch.isalnum())
+
+
+def edit_distance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+# BK-tree over normalized plate strings. Finding every plate within distance d of
+# a read only visits children whose edge distance lies in [k - d, k + d].
+class _BKTree:
+    def __init__(self):
+        self.root = None
+
+    def add(self, word):
+        if self.root is None:
+            self.root = (word, {})
+            return
+        node = self.root
+        while True:
+            distance = edit_distance(word, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (word, {})
+                return
+            node = child
+
+    def search(self, word, max_distance):
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_word, children = stack.pop()
+            distance = edit_distance(word, node_word)
+            if distance <= max_distance:
+                found.append((distance, node_word))
+            for edge, child in children.items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        return found
+
+
+# In-memory whitelist of registered plates. Exact reads resolve through a dict;
+# reads with up to max_distance OCR errors resolve through the BK-tree. The index
+# follows the registry through its change listener, so no file or database I/O
+# happens when a read is looked up at the barrier.
+class OwnerIndex:
+    def __init__(self, registry=None, max_distance=2):
+        self.registry = registry or default_registry()
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self.reload()
+        self.registry.add_listener(self._on_change)
+
+    def reload(self):
+        with self._lock:
+            self.by_plate = {}
+            self.tree = _BKTree()
+            for record in self.registry.records():
+                self._add(record)
+
+    def _add(self, record):
+        plate = normalize_plate(record.get("plate_text", ""))
+        if plate:
+            self.by_plate.setdefault(plate, {})[record["id"]] = record
+            self.tree.add(plate)
+
+    # Deleted plates stay in the BK-tree as empty entries; lookups skip them
+    def _remove(self, record):
+        plate = normalize_plate(record.get("plate_text", ""))
+        owners = self.by_plate.get(plate)
+        if owners is not None:
+            owners.pop(record["id"], None)
+
+    def _on_change(self, action, record):
+        with self._lock:
+            if action == "add":
+                self._add(record)
+            elif action == "delete":
+                self._remove(record)
+
+    # Returns (record, distance) for the registered plate closest to the read, or
+    # None when nothing is close enough or two different plates tie.
+    def lookup(self, text):
+        plate = normalize_plate(text)
+        if not plate:
+            return None
+        with self._lock:
+            owners = self.by_plate.get(plate)
+            if owners:
+                return next(iter(owners.values())), 0
+            matches = sorted((distance, word) for distance, word in self.tree.search(plate, self.max_distance)
+                             if self.by_plate.get(word))
+        if not matches:
+            return None
+        if len(matches) > 1 and matches[0][0] == matches[1][0]:
+            return None
+        distance, word = matches[0]
+        with self._lock:
+            owners = self.by_plate.get(word)
+            return (next(iter(owners.values())), distance) if owners else None
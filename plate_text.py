@@ -0,0 +1,101 @@
+from collections import namedtuple
+
+import numpy as np
+
+# text is the plate string in reading order, confidences holds one score per
+# character and characters the (x1, y1, x2, y2, label) boxes in frame coordinates.
+PlateRead = namedtuple("PlateRead", ["text", "confidences", "characters"])
+
+EMPTY_READ = PlateRead("", (), [])
+
+
+def _iou_matrix(boxes):
+    x1 = np.maximum(boxes[:, None, 0], boxes[None, :, 0])
+    y1 = np.maximum(boxes[:, None, 1], boxes[None, :, 1])
+    x2 = np.minimum(boxes[:, None, 2], boxes[None, :, 2])
+    y2 = np.minimum(boxes[:, None, 3], boxes[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    union = area[:, None] + area[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+# Class-agnostic NMS over the characters of every plate at once. Boxes of
+# different plates are shifted apart so they never suppress each other, and a
+# character detected twice under two classes keeps only its best-scoring label.
+def batched_nms(boxes, scores, groups, iou_threshold):
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    shift = (boxes.max() + 1) * groups.astype(boxes.dtype)
+    shifted = boxes + shift[:, None]
+    order = np.argsort(-scores, kind="stable")
+    overlaps = _iou_matrix(shifted[order]) > iou_threshold
+    suppressed = np.zeros(len(order), dtype=bool)
+    keep = []
+    for i in range(len(order)):
+        if suppressed[i]:
+            continue
+        keep.append(order[i])
+        suppressed |= overlaps[i]
+    return np.sort(np.array(keep, dtype=np.int64))
+
+
+# Decode the raw character-model output of a whole batch of plates into plate
+# strings. Inputs are the concatenated detections of all plates: xyxy (N, 4) in
+# plate coordinates, cls and conf (N,), and plate_index (N,) telling which plate
+# each detection belongs to. offsets (num_plates, 2) moves boxes into frame
+# coordinates. Characters are filtered by confidence, de-duplicated with NMS and
+# ordered top line first, then left to right, so two-line plates read correctly.
+def decode_plates(xyxy, cls, conf, plate_index, num_plates, names, offsets=None,
+                  min_conf=0.25, iou_threshold=0.5, line_gap=0.6):
+    xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+    cls = np.asarray(cls, dtype=np.int64).reshape(-1)
+    conf = np.asarray(conf, dtype=np.float32).reshape(-1)
+    plate_index = np.asarray(plate_index, dtype=np.int64).reshape(-1)
+
+    mask = conf >= min_conf
+    xyxy, cls, conf, plate_index = xyxy[mask], cls[mask], conf[mask], plate_index[mask]
+    keep = batched_nms(xyxy, conf, plate_index, iou_threshold)
+    xyxy, cls, conf, plate_index = xyxy[keep], cls[keep], conf[keep], plate_index[keep]
+    if offsets is not None and len(xyxy):
+        offsets = np.asarray(offsets, dtype=np.float32).reshape(-1, 2)
+        xyxy = xyxy + np.tile(offsets[plate_index], 2)
+
+    # A plate has two lines when the largest gap between its sorted character
+    # centres exceeds line_gap of the mean character height; the split is in the
+    # middle of that gap. Looking at the largest gap rather than the total spread
+    # keeps long, tilted single-line plates on one line.
+    center_y = (xyxy[:, 1] + xyxy[:, 3]) / 2
+    center_x = (xyxy[:, 0] + xyxy[:, 2]) / 2
+    height = xyxy[:, 3] - xyxy[:, 1]
+    counts = np.bincount(plate_index, minlength=num_plates)
+    mean_height = np.bincount(plate_index, weights=height, minlength=num_plates) / np.maximum(counts, 1)
+    by_y = np.lexsort((center_y, plate_index))
+    sorted_y, sorted_plate = center_y[by_y], plate_index[by_y]
+    gaps = np.diff(sorted_y)
+    gaps[sorted_plate[1:] != sorted_plate[:-1]] = -np.inf
+    largest = np.full(num_plates, -np.inf, dtype=np.float32)
+    np.maximum.at(largest, sorted_plate[1:], gaps)
+    split = np.full(num_plates, np.inf, dtype=np.float32)
+    at_largest = np.flatnonzero((gaps == largest[sorted_plate[1:]]) & (gaps > line_gap * mean_height[sorted_plate[1:]]))
+    split[sorted_plate[at_largest + 1]] = (sorted_y[at_largest] + sorted_y[at_largest + 1]) / 2
+    line = (center_y > split[plate_index]).astype(np.int64)
+
+    order = np.lexsort((center_x, line, plate_index))
+    xyxy, cls, conf, plate_index = xyxy[order], cls[order], conf[order], plate_index[order]
+    labels = [str(names.get(c, c)) if names is not None else str(c) for c in cls.tolist()]
+    boxes = xyxy.astype(np.int64).tolist()
+    confidences = conf.tolist()
+
+    reads = []
+    bounds = np.concatenate([[0], np.cumsum(counts)])
+    for plate in range(num_plates):
+        start, end = bounds[plate], bounds[plate + 1]
+        characters = [(*boxes[i], labels[i]) for i in range(start, end)]
+        reads.append(PlateRead("".join(labels[start:end]), tuple(confidences[start:end]), characters))
+    return reads
+
+
+# Characters of several reads as (x1, y1, x2, y2, label), in reading order
+def characters_from_reads(reads):
+    return [char for read in reads for char in read.characters]
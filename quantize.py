@@ -0,0 +1,126 @@
+import argparse
+import os
+import random
+
+import cv2
+
+from backends import OnnxBackend, UltralyticsBackend, compare_backends, export_model, exported_path, load_model
+from storage import crop_paths
+from config import settings
+
+
+# Saved plate crops (not the full-frame captures kept in the same store),
+# shuffled with a fixed seed and later split into a calibration set and a
+# held-out set used to measure the quantized model. These are the inputs of the
+# character model.
+def load_crops(directory, limit):
+    paths = crop_paths(directory)
+    random.Random(0).shuffle(paths)
+    images = []
+    for path in paths:
+        image = cv2.imread(path)
+        if image is not None:
+            images.append(image)
+        if len(images) >= limit:
+            break
+    return images
+
+
+# Inputs of the plate model are cars cut out by the vehicle model, not plates:
+# the configured car model runs over full frames (the GUIs' captures in the
+# store, or every image in frames_dir) and each detected car is cropped.
+def load_car_crops(directory, limit, frames_dir=None):
+    if frames_dir:
+        paths = [os.path.join(folder, name) for folder, _, names in os.walk(frames_dir) for name in sorted(names)]
+    else:
+        paths = crop_paths(directory, captures=True)
+    random.Random(0).shuffle(paths)
+    spec = dict(settings["models"]["car"])
+    car_model = load_model(spec.pop("weights"), spec)
+    crops = []
+    for path in paths:
+        frame = cv2.imread(path)
+        if frame is None:
+            continue
+        for box in car_model.predict([frame])[0]:
+            x1, y1, x2, y2 = map(int, box.xyxy[0])
+            crop = frame[max(0, y1):y2, max(0, x1):x2]
+            if crop.size > 0:
+                crops.append(crop)
+        if len(crops) >= limit:
+            break
+    return crops[:limit]
+
+
+# Feeds letterboxed crops to ONNX Runtime's calibrator one at a time
+class CropCalibrationReader:
+    def __init__(self, backend, images):
+        self.input_name = backend.input.name
+        self.blobs = iter([backend._letterbox(image)[0][None] for image in images])
+
+    def get_next(self):
+        blob = next(self.blobs, None)
+        return None if blob is None else {self.input_name: blob}
+
+
+# Statically quantize the ONNX export of pt_path to INT8 using crops of the
+# model's own inputs for calibration. Weights are quantized per channel;
+# activation ranges come from the calibration crops. Returns the path of the quantized model.
+def quantize_model(pt_path, calibration_images, output_path=None, method="minmax"):
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    fp32_path = exported_path(pt_path, "onnx")
+    if not os.path.exists(fp32_path):
+        fp32_path = export_model(pt_path, "onnx")
+    output_path = output_path or os.path.splitext(fp32_path)[0] + "_int8.onnx"
+    prepared_path = os.path.splitext(fp32_path)[0] + "_prep.onnx"
+    quant_pre_process(fp32_path, prepared_path)
+
+    methods = {"minmax": CalibrationMethod.MinMax, "entropy": CalibrationMethod.Entropy,
+               "percentile": CalibrationMethod.Percentile}
+    quantize_static(prepared_path, output_path, CropCalibrationReader(OnnxBackend(fp32_path), calibration_images),
+                    quant_format=QuantFormat.QDQ, per_channel=True,
+                    weight_type=QuantType.QInt8, activation_type=QuantType.QUInt8,
+                    calibrate_method=methods[method])
+    os.remove(prepared_path)
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize the character model (calibrated on saved plate crops) or the "
+                                                 "plate model (calibrated on car crops cut from full frames) to INT8.")
+    parser.add_argument("model", help=".pt model to quantize")
+    parser.add_argument("--stage", choices=["char", "plate"], default="char", help="which model of the cascade it is")
+    parser.add_argument("--crops", default=settings["storage"]["directory"], help="saved plates directory")
+    parser.add_argument("--frames", help="full frames for --stage plate (default: the captures in the saved plates directory)")
+    parser.add_argument("--calibration", type=int, default=200, help="number of crops used for calibration")
+    parser.add_argument("--evaluation", type=int, default=100, help="number of held-out crops used for the report")
+    parser.add_argument("--method", choices=["minmax", "entropy", "percentile"], default="minmax")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    if args.stage == "plate":
+        images = load_car_crops(args.crops, args.calibration + args.evaluation, args.frames)
+    else:
+        images = load_crops(args.crops, args.calibration + args.evaluation)
+    if len(images) <= args.evaluation:
+        parser.error(f"need more than {args.evaluation} crops for the {args.stage} model, found {len(images)}")
+    calibration, evaluation = images[args.evaluation:], images[:args.evaluation]
+
+    int8_path = quantize_model(args.model, calibration, args.output, args.method)
+    fp32_path = exported_path(args.model, "onnx")
+    reference = UltralyticsBackend(args.model)
+    print(f"quantized model: {int8_path}")
+    print(f"size: {os.path.getsize(args.model) / 1e6:.1f} MB (.pt), {os.path.getsize(fp32_path) / 1e6:.1f} MB (fp32 onnx), "
+          f"{os.path.getsize(int8_path) / 1e6:.1f} MB (int8 onnx)")
+    for label, path in (("fp32 onnx", fp32_path), ("int8 onnx", int8_path)):
+        report = compare_backends(reference, OnnxBackend(path), evaluation, iou_threshold=0.5)
+        print(f"{label} vs .pt: match {report['match_rate']:.3f}, max conf delta {report['max_conf_delta']:.3f}, "
+              f"extra boxes {report['extra_boxes']}, latency {report['reference_ms']:.1f} ms -> {report['candidate_ms']:.1f} ms")
+    print(f'use it with: "models": {{"{args.stage}": {{"backend": "onnx", "path": "{int8_path}"}}}}')
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
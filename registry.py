@@ -0,0 +1,180 @@
+import csv
+import glob
+import os
+import sqlite3
+import threading
+
+from config import settings
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS plates (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    plate_text TEXT NOT NULL DEFAULT '',
+    timestamp TEXT NOT NULL DEFAULT '',
+    plate_file TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS plates_name ON plates (name);
+CREATE INDEX IF NOT EXISTS plates_plate_text ON plates (plate_text);
+CREATE INDEX IF NOT EXISTS plates_plate_file ON plates (plate_file);
+CREATE INDEX IF NOT EXISTS plates_timestamp ON plates (timestamp);
+CREATE TABLE IF NOT EXISTS imported_files (
+    path TEXT PRIMARY KEY
+);
+"""
+
+FIELDS = ["id", "name", "plate_text", "timestamp", "plate_file"]
+
+
+# Plate owner records in an embedded SQLite database. WAL mode lets the review
+# window read while the detector writes, and every lookup or edit goes through an
+# index instead of rewriting the whole daily CSV.
+class PlateRegistry:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._listeners = []
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.executescript(_SCHEMA)
+
+    # callback(action, record) is called after every change, with action "add" or
+    # "delete", so in-memory indexes can follow the registry incrementally.
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, action, records):
+        for record in records:
+            for callback in list(self._listeners):
+                callback(action, record)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def _write(self, sql, params=()):
+        with self._lock, self.conn:
+            return self.conn.execute(sql, params)
+
+    def find_by_name(self, name):
+        rows = self._query("SELECT * FROM plates WHERE name = ? LIMIT 1", (name,))
+        return rows[0] if rows else None
+
+    def find_by_plate_file(self, plate_file):
+        rows = self._query("SELECT * FROM plates WHERE plate_file = ? LIMIT 1", (plate_file,))
+        return rows[0] if rows else None
+
+    def find_by_plate_text(self, plate_text):
+        return self._query("SELECT * FROM plates WHERE plate_text = ?", (plate_text,))
+
+    def records(self):
+        return self._query("SELECT * FROM plates ORDER BY timestamp")
+
+    def add(self, name, plate_file="", timestamp="", plate_text=""):
+        cursor = self._write("INSERT INTO plates (name, plate_text, timestamp, plate_file) VALUES (?, ?, ?, ?)",
+                             (name, plate_text, timestamp, plate_file))
+        self._notify("add", [{"id": cursor.lastrowid, "name": name, "plate_text": plate_text,
+                              "timestamp": timestamp, "plate_file": plate_file}])
+        return cursor.lastrowid
+
+    def delete_by_plate_file(self, plate_file):
+        return self.delete_plate_files([plate_file])
+
+    def delete_plate_files(self, plate_files):
+        plate_files = list(plate_files)
+        with self._lock, self.conn:
+            deleted = []
+            for plate_file in plate_files:
+                deleted.extend(dict(row) for row in self.conn.execute(
+                    "SELECT * FROM plates WHERE plate_file = ?", (plate_file,)))
+            self.conn.executemany("DELETE FROM plates WHERE plate_file = ?", [(f,) for f in plate_files])
+        self._notify("delete", deleted)
+        return len(deleted)
+
+    # Write every record to a CSV file with the columns of the old daily files
+    def export_csv(self, path):
+        with open(path, 'w', newline='') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=['name', 'timestamp', 'plate_file', 'plate_text'])
+            writer.writeheader()
+            for record in self.records():
+                writer.writerow({key: record[key] for key in writer.fieldnames})
+
+    # One-shot import of csv_files/<date>/plates_data.csv. Each file is imported
+    # once; its path is remembered so restarts do not duplicate rows. The old
+    # files hold paths like saved_plates\plate_....png or absolute D:\... paths;
+    # store_path (e.g. PlateStore.relative_path) turns them into the store's
+    # relative paths so they match the crops listed by the store.
+    def import_csv_files(self, base_csv_dir, store_path=None):
+        imported = 0
+        for csv_path in sorted(glob.glob(os.path.join(base_csv_dir, "*", "plates_data.csv"))):
+            key = os.path.abspath(csv_path)
+            if self._query("SELECT path FROM imported_files WHERE path = ?", (key,)):
+                continue
+            with open(csv_path, 'r', newline='') as csvfile:
+                rows = [row for row in csv.DictReader(csvfile) if row.get('name')]
+            with self._lock, self.conn:
+                self.conn.executemany(
+                    "INSERT INTO plates (name, plate_text, timestamp, plate_file) VALUES (?, ?, ?, ?)",
+                    [(row['name'], row.get('plate_text') or '', row.get('timestamp') or '',
+                      _legacy_plate_file(row.get('plate_file') or '', store_path))
+                     for row in rows])
+                self.conn.execute("INSERT INTO imported_files (path) VALUES (?)", (key,))
+            imported += len(rows)
+        if imported:
+            self._notify("add", self._query("SELECT * FROM plates ORDER BY id DESC LIMIT ?", (imported,)))
+        return imported
+
+    # Rewrite plate_file values imported with their old Windows or absolute paths
+    # before import_csv_files normalized them
+    def normalize_plate_files(self, store_path):
+        changes = []
+        for row in self._query("SELECT id, plate_file FROM plates"):
+            plate_file = _legacy_plate_file(row['plate_file'], store_path)
+            if plate_file != row['plate_file']:
+                changes.append((plate_file, row['id']))
+        if changes:
+            with self._lock, self.conn:
+                self.conn.executemany("UPDATE plates SET plate_file = ? WHERE id = ?", changes)
+        return len(changes)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+# A plate_file of the old CSV files as a path relative to the plate store. Paths
+# that do not lie under the store (e.g. another drive) fall back to the file name,
+# which is where rebuild_index puts crops found flat in the store root.
+def _legacy_plate_file(plate_file, store_path):
+    if not plate_file or store_path is None:
+        return plate_file
+    path = plate_file.replace("\\", "/")
+    try:
+        relative = store_path(path)
+    except ValueError:
+        relative = ""
+    if not relative or relative.startswith("..") or os.path.isabs(relative) or ":" in relative:
+        relative = path.rsplit("/", 1)[-1]
+    return relative
+
+
+_default_registry = None
+
+
+# Registry shared by every window of the process; imports old CSV files on first use
+def default_registry():
+    global _default_registry
+    if _default_registry is None:
+        from storage import default_store
+        store_path = default_store().relative_path
+        _default_registry = PlateRegistry(settings["registry"]["path"])
+        _default_registry.normalize_plate_files(store_path)
+        _default_registry.import_csv_files(settings["registry"]["csv_dir"], store_path)
+    return _default_registry
@@ -0,0 +1,66 @@
+import sys
+
+import cv2
+import numpy as np
+
+
+# Region of the frame the vehicle detector looks at, e.g. the lane in front of the
+# barrier. The region is cropped (and optionally downsampled) before the car
+# model runs; boxes are mapped back to full-frame coordinates so the plate and
+# character stages still crop from the full-resolution frame.
+class RegionOfInterest:
+    def __init__(self, rect=None, polygon=None, scale=1.0):
+        self.polygon = np.array(polygon, dtype=np.int32) if polygon is not None else None
+        if rect is None and self.polygon is not None:
+            x, y, w, h = cv2.boundingRect(self.polygon)
+            rect = (x, y, x + w, y + h)
+        self.rect = tuple(map(int, rect)) if rect is not None else None
+        self.scale = float(scale)
+        self._warned = False
+
+    # Build from a camera entry of config.settings; returns None when unset
+    @classmethod
+    def from_config(cls, camera):
+        roi = camera.get("roi")
+        scale = camera.get("roi_scale", 1.0)
+        if not roi:
+            return None if scale == 1.0 else cls(scale=scale)
+        if isinstance(roi[0], (list, tuple)):
+            return cls(polygon=roi, scale=scale)
+        return cls(rect=roi, scale=scale)
+
+    # The region clamped to the frame; empty (x2 == x1 or y2 == y1) when it lies
+    # outside, e.g. an ROI set for 1080p on a 720p stream
+    def _bounds(self, frame):
+        height, width = frame.shape[:2]
+        if self.rect is None:
+            return 0, 0, width, height
+        x1, y1 = min(max(0, self.rect[0]), width), min(max(0, self.rect[1]), height)
+        return x1, y1, max(x1, min(width, self.rect[2])), max(y1, min(height, self.rect[3]))
+
+    # Returns the image for the vehicle model and the (x, y) offset of the region.
+    # The image is empty when the region misses the frame; that is reported once.
+    def crop(self, frame):
+        x1, y1, x2, y2 = self._bounds(frame)
+        region = frame[y1:y2, x1:x2]
+        if region.size == 0:
+            if not self._warned:
+                self._warned = True
+                print(f"Region of interest {self.rect} lies outside the {frame.shape[1]}x{frame.shape[0]} frame",
+                      file=sys.stderr, flush=True)
+            return region, (x1, y1)
+        if self.polygon is not None:
+            mask = np.zeros(region.shape[:2], dtype=np.uint8)
+            cv2.fillPoly(mask, [self.polygon - np.array([x1, y1], dtype=np.int32)], 255)
+            region = cv2.bitwise_and(region, region, mask=mask)
+        if self.scale != 1.0:
+            size = (max(1, int(region.shape[1] * self.scale)), max(1, int(region.shape[0] * self.scale)))
+            region = cv2.resize(region, size, interpolation=cv2.INTER_AREA)
+        return region, (x1, y1)
+
+    # Map x1, y1, x2, y2 columns of boxes found in the crop back to the frame
+    def to_frame(self, xyxy, offset):
+        mapped = xyxy / self.scale if self.scale != 1.0 else xyxy * 1
+        mapped[:, [0, 2]] += offset[0]
+        mapped[:, [1, 3]] += offset[1]
+        return mapped
@@ -0,0 +1,428 @@
+import argparse
+import os
+import queue
+import secrets
+import socket
+import stat
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+
+from config import settings
+from shm_frames import FrameRing
+
+
+# The key that shipped as the default in earlier versions; anyone can read it
+_PUBLIC_AUTHKEY = "security-gate"
+
+
+# Per-user directory for the socket and the generated key. It must belong to
+# this user and be closed to everyone else, or a local user could replace the
+# socket or read the key.
+def _private_dir():
+    if sys.platform == "win32":
+        directory = os.path.join(os.environ.get("LOCALAPPDATA") or tempfile.gettempdir(), "security_gate")
+        os.makedirs(directory, exist_ok=True)
+        return directory
+    base = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    directory = os.path.join(base, f"security_gate-{os.getuid()}")
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise RuntimeError(f"{directory} must be a directory owned by this user with mode 0700")
+    return directory
+
+
+# Read the per-install key, generating it on first use. The file is created
+# exclusively with mode 0600, so a server and a client starting together end up
+# with the same key.
+def _load_authkey(path):
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path, 'r') as key_file:
+            key = key_file.read().strip()
+        if key:
+            return key
+        raise RuntimeError(f"Server key file {path} is empty; delete it to generate a new key")
+    key = secrets.token_hex(32)
+    with os.fdopen(fd, 'w') as key_file:
+        key_file.write(key)
+    return key
+
+
+def _server_settings():
+    server = dict(settings["server"])
+    if not server.get("address"):
+        server["address"] = r"\\.\pipe\security_gate" if sys.platform == "win32" else os.path.join(_private_dir(), "server.sock")
+    authkey = server.get("authkey")
+    if authkey == _PUBLIC_AUTHKEY:
+        raise ValueError("server.authkey is the publicly known default; set a secret or leave it empty to generate one")
+    if not authkey:
+        authkey = _load_authkey(server.get("authkey_file") or os.path.join(_private_dir(), "authkey"))
+    server["authkey"] = authkey.encode() if isinstance(authkey, str) else authkey
+    return server
+
+
+# Remove a socket file left behind by a server that is no longer running. Any
+# other file at the address, or a socket a live server still accepts on, is left
+# alone and reported.
+def _remove_stale_socket(address):
+    try:
+        info = os.lstat(address)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(info.st_mode):
+        raise RuntimeError(f"{address} exists and is not a socket")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(address)
+    except ConnectionRefusedError:
+        os.remove(address)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"Another server is already listening on {address}")
+
+
+# Local inference server that owns the only PipelineModel on the machine. Every
+# GUI or lane connects over a Unix socket (a named pipe on Windows); requests
+# that arrive within max_wait_ms of each other are batched into one call per
+# model stage, so two lanes share one set of loaded models and one batch. A
+# detect_batch request carries a list of frames, which all go into the same
+# batch; max_batch counts frames, not requests.
+class InferenceServer:
+    def __init__(self, pipeline, address=None, authkey=None, max_batch=None, max_wait_ms=None):
+        server = _server_settings()
+        self.pipeline = pipeline
+        self.address = address or server["address"]
+        self.authkey = authkey or server["authkey"]
+        self.max_batch = max_batch or server["max_batch"]
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else server["max_wait_ms"]) / 1000.0
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.served = 0
+        self.rings = {}
+        self.ring_idle = 10.0
+
+    def serve_forever(self):
+        threading.Thread(target=self._batch_loop, name="server-batcher", daemon=True).start()
+        # A socket file left behind by a previous run would block the bind
+        if sys.platform != "win32":
+            _remove_stale_socket(self.address)
+        with Listener(self.address, authkey=self.authkey) as listener:
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self._client_loop, args=(conn,), name="server-client", daemon=True).start()
+
+    # One thread per connected client: receive a request, wait for its batched
+    # result, reply. Requests are (op, args) tuples.
+    def _client_loop(self, conn):
+        with conn:
+            while True:
+                try:
+                    op, args = conn.recv()
+                except (EOFError, OSError):
+                    return
+                future = Future()
+                self.requests.put((op, args, future))
+                try:
+                    conn.send(("ok", future.result()))
+                except Exception as exc:
+                    try:
+                        conn.send(("error", repr(exc)))
+                    except OSError:
+                        return
+
+    @staticmethod
+    def _frame_count(request):
+        op, args, _ = request
+        return len(args[0]) if op in ("detect_batch", "read_batch", "detect_shared", "read_shared") else 1
+
+    def _collect(self):
+        batch = [self.requests.get()]
+        frames = self._frame_count(batch[0])
+        deadline = time.monotonic() + self.max_wait
+        while frames < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+            frames += self._frame_count(batch[-1])
+        return batch
+
+    def _batch_loop(self):
+        while True:
+            batch = self._collect()
+            groups = {}
+            for request in batch:
+                groups.setdefault(request[0], []).append(request)
+            for op, requests in groups.items():
+                try:
+                    results = self._run(op, [args for _, args, _ in requests])
+                except Exception as exc:
+                    for _, _, future in requests:
+                        future.set_exception(exc)
+                    continue
+                for (_, _, future), result in zip(requests, results):
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+            self.batches += 1
+            self.served += len(batch)
+            self._detach_idle_rings()
+
+    # Rings of the clients by name, with the time each was last used. A client
+    # that closes or recreates a ring (e.g. when its stream changes size) never
+    # says so, so rings unused for ring_idle seconds are detached.
+    def _ring(self, descriptor):
+        entry = self.rings.get(descriptor[0])
+        if entry is None:
+            entry = self.rings[descriptor[0]] = [FrameRing.attach(*descriptor), 0.0]
+        entry[1] = time.monotonic()
+        return entry[0]
+
+    def _detach_idle_rings(self):
+        now = time.monotonic()
+        for name, (ring, last_used) in list(self.rings.items()):
+            if now - last_used > self.ring_idle:
+                del self.rings[name]
+                ring.close()
+
+    # Frames in the clients' shared-memory rings are read in place. A
+    # detect_shared or read_shared request carries a list of (descriptor, slot,
+    # seq, roi), and all of them go through one detect_batch or read_batch call.
+    # A request with a frame that the client overwrote before or during
+    # inference fails with an overrun.
+    def _shared_batch(self, method, args_list):
+        frames, rois, refs = [], [], []
+        results = [[] for _ in args_list]
+        for i, (items,) in enumerate(args_list):
+            for descriptor, slot, seq, roi in items:
+                ring = self._ring(descriptor)
+                frame = ring.view(slot, seq)
+                if frame is None:
+                    results[i] = _overrun(seq, "before")
+                    break
+                frames.append(frame)
+                rois.append(roi)
+                refs.append((i, ring, slot, seq))
+        detections = getattr(self.pipeline, method)(frames, rois) if frames else []
+        for (i, ring, slot, seq), (car_boxes, plates, reads) in zip(refs, detections):
+            if isinstance(results[i], Exception):
+                continue
+            # Plate crops are views into the ring; copy them before checking the
+            # frame is still intact so the reply cannot change afterwards
+            plates = _copy_plates(plates)
+            if ring.valid(slot, seq):
+                results[i].append((car_boxes, plates, reads))
+            else:
+                results[i] = _overrun(seq, "during")
+        return results
+
+    # detect_cars on ring frames, (descriptor, slot, seq, roi) per request, in one batch
+    def _detect_cars_shared(self, args_list):
+        frames, rois, refs = [], [], []
+        results = [None] * len(args_list)
+        for i, (descriptor, slot, seq, roi) in enumerate(args_list):
+            ring = self._ring(descriptor)
+            frame = ring.view(slot, seq)
+            if frame is None:
+                results[i] = _overrun(seq, "before")
+                continue
+            frames.append(frame)
+            rois.append(roi)
+            refs.append((i, ring, slot, seq))
+        detections = self.pipeline._detect_cars(frames, rois) if frames else []
+        for (i, ring, slot, seq), car_boxes in zip(refs, detections):
+            results[i] = car_boxes if ring.valid(slot, seq) else _overrun(seq, "during")
+        return results
+
+    def _read_vehicles_shared(self, descriptor, slot, seq, car_boxes):
+        ring = self._ring(descriptor)
+        frame = ring.view(slot, seq)
+        if frame is None:
+            return _overrun(seq, "before")
+        results = [(_copy_plates(plates), reads) for plates, reads in self.pipeline.read_vehicles(frame, car_boxes)]
+        return results if ring.valid(slot, seq) else _overrun(seq, "during")
+
+    # The frames of every detect_batch (or read_batch) request go through one
+    # pipeline call and the results are split back per request
+    def _batched(self, method, args_list):
+        frames, rois = [], []
+        for request_frames, request_rois in args_list:
+            frames.extend(request_frames)
+            rois.extend(request_rois)
+        detections = getattr(self.pipeline, method)(frames, rois)
+        results = []
+        for request_frames, _ in args_list:
+            results.append(detections[:len(request_frames)])
+            detections = detections[len(request_frames):]
+        return results
+
+    # detect_batch, read_batch and detect_cars requests of all clients (and their
+    # shared-memory forms) share one batch; reading selected vehicles is per frame
+    def _run(self, op, args_list):
+        if op == "detect_shared":
+            return self._shared_batch("detect_batch", args_list)
+        if op == "read_shared":
+            return self._shared_batch("read_batch", args_list)
+        if op in ("detect_batch", "read_batch"):
+            return self._batched(op, args_list)
+        if op == "detect_cars":
+            return self.pipeline._detect_cars([args[0] for args in args_list], [args[1] for args in args_list])
+        if op == "detect_cars_shared":
+            return self._detect_cars_shared(args_list)
+        if op == "read_vehicles":
+            return [self.pipeline.read_vehicles(*args) for args in args_list]
+        if op == "read_vehicles_shared":
+            return [self._read_vehicles_shared(*args) for args in args_list]
+        if op == "stats":
+            return [{"batches": self.batches, "served": self.served} for _ in args_list]
+        raise ValueError(f"Unknown request: {op}")
+
+
+def _copy_plates(plates):
+    return [(x1, y1, x2, y2, crop.copy()) for x1, y1, x2, y2, crop in plates]
+
+
+def _overrun(seq, when):
+    return RuntimeError(f"Frame {seq} was overwritten {when} inference")
+
+
+# Client side of InferenceServer with the same detection methods as
+# PipelineModel, so a GUI can use either one. Connecting happens in load() or
+# load_async(), mirroring model loading.
+class InferenceClient:
+    def __init__(self, address=None, authkey=None, lazy=False):
+        server = _server_settings()
+        self.address = address or server["address"]
+        self.authkey = authkey or server["authkey"]
+        self.conn = None
+        self.ready = threading.Event()
+        self.load_error = None
+        self._lock = threading.Lock()
+        if not lazy:
+            self.load()
+
+    def load(self):
+        try:
+            self.conn = Client(self.address, authkey=self.authkey)
+        except Exception as exc:
+            self.load_error = exc
+            raise
+        finally:
+            self.ready.set()
+
+    def load_async(self, warm_up=True, callback=None):
+        def run():
+            error = None
+            try:
+                self.load()
+            except Exception as exc:
+                error = exc
+            if callback is not None:
+                callback(error)
+
+        thread = threading.Thread(target=run, name="server-connect", daemon=True)
+        thread.start()
+        return thread
+
+    def _call(self, op, *args):
+        self.ready.wait()
+        if self.load_error is not None:
+            raise RuntimeError(f"Inference server unavailable: {self.load_error}")
+        with self._lock:
+            self.conn.send((op, args))
+            status, result = self.conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"Inference server error: {result}")
+        return result
+
+    def detect(self, frame, roi=None):
+        return self.detect_batch([frame], [roi])[0]
+
+    # Detect on a frame the caller wrote into a shm_frames.FrameRing (e.g. a
+    # camera.LatestFrameCapture with ring_slots); only the slot and sequence
+    # number cross the process boundary
+    def detect_shared(self, ring, slot, seq, roi=None):
+        return self.detect_shared_batch([(ring, slot, seq, roi)])[0]
+
+    # Several ring frames, e.g. one per lane, as (ring, slot, seq, roi) in one request
+    def detect_shared_batch(self, items):
+        return self._call("detect_shared", [(ring.descriptor(), slot, seq, roi) for ring, slot, seq, roi in items])
+
+    def read_shared(self, ring, slot, seq, roi=None):
+        return self.read_shared_batch([(ring, slot, seq, roi)])[0]
+
+    def read_shared_batch(self, items):
+        return self._call("read_shared", [(ring.descriptor(), slot, seq, roi) for ring, slot, seq, roi in items])
+
+    def detect_cars_shared(self, ring, slot, seq, roi=None):
+        return self._call("detect_cars_shared", ring.descriptor(), slot, seq, roi)
+
+    def read_vehicles_shared(self, ring, slot, seq, car_boxes):
+        return self._call("read_vehicles_shared", ring.descriptor(), slot, seq, list(car_boxes))
+
+    # All frames travel in one request and are batched together on the server
+    def detect_batch(self, frames, rois=None):
+        frames = list(frames)
+        rois = list(rois or [None] * len(frames))
+        return self._call("detect_batch", frames, rois)
+
+    # Like detect_batch, with one plate_text.PlateRead per plate (see PipelineModel.read_batch)
+    def read_batch(self, frames, rois=None):
+        frames = list(frames)
+        rois = list(rois or [None] * len(frames))
+        return self._call("read_batch", frames, rois)
+
+    def read(self, frame, roi=None):
+        return self.read_batch([frame], [roi])[0]
+
+    def detect_cars(self, frame, roi=None):
+        return self._call("detect_cars", frame, roi)
+
+    def read_vehicles(self, frame, car_boxes):
+        return self._call("read_vehicles", frame, list(car_boxes))
+
+    def stats(self):
+        return self._call("stats")
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+# The GUIs use the shared server when config "server" is enabled, otherwise
+# their own in-process pipeline
+def create_pipeline(lazy=True):
+    if settings["server"]["enabled"]:
+        return InferenceClient(lazy=lazy)
+    from model import PipelineModel
+    return PipelineModel(lazy=lazy)
+
+
+def main():
+    server = _server_settings()
+    parser = argparse.ArgumentParser(description="Serve the gate models to local GUIs and lanes.")
+    parser.add_argument("--address", default=server["address"])
+    parser.add_argument("--max-batch", type=int, default=server["max_batch"])
+    parser.add_argument("--max-wait-ms", type=float, default=server["max_wait_ms"])
+    args = parser.parse_args()
+
+    from model import PipelineModel
+    pipeline = PipelineModel()
+    pipeline.warm_up()
+    print(f"Serving models on {args.address}")
+    InferenceServer(pipeline, args.address, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def _attach(name):
+    # Attaching must not register the block with this process's resource
+    # tracker, or it would be unlinked when the attaching process exits
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return shm
+
+
+# Ring of preallocated frames in shared memory. The capture side writes each
+# frame in place into the next slot (cv2.VideoCapture.read can decode straight
+# into it) and passes only (slot, seq) to the inference process, which reads a
+# numpy view of the same memory. Every slot records the sequence number of the
+# frame it holds (-1 while being written), so a reader can tell when the writer
+# has lapped it and the frame it was given has been overwritten.
+class FrameRing:
+    def __init__(self, shm, slots, shape, dtype, owner):
+        self.shm = shm
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = owner
+        # slots sequence numbers followed by the newest committed sequence number
+        self.seqs = np.ndarray((slots + 1,), dtype=np.int64, buffer=shm.buf)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=self.dtype, buffer=shm.buf, offset=self.seqs.nbytes)
+        self.next_seq = int(self.seqs[slots]) + 1 if not owner else 0
+
+    @classmethod
+    def create(cls, slots, shape, dtype=np.uint8, name=None):
+        header = (slots + 1) * np.dtype(np.int64).itemsize
+        size = header + slots * int(np.prod(shape)) * np.dtype(dtype).itemsize
+        ring = cls(shared_memory.SharedMemory(name=name, create=True, size=size), slots, shape, dtype, owner=True)
+        ring.seqs[:] = -1
+        return ring
+
+    @classmethod
+    def attach(cls, name, slots, shape, dtype="uint8"):
+        return cls(_attach(name), slots, shape, dtype, owner=False)
+
+    # Everything another process needs to attach: FrameRing.attach(*descriptor)
+    def descriptor(self):
+        return self.shm.name, self.slots, self.shape, self.dtype.str
+
+    # Writer side: reserve the next slot and return (slot, view) to fill in place
+    def begin_write(self):
+        slot = self.next_seq % self.slots
+        self.seqs[slot] = -1
+        return slot, self.frames[slot]
+
+    # Writer side: publish the slot filled since begin_write; returns its seq
+    def commit(self, slot):
+        seq = self.next_seq
+        self.next_seq += 1
+        self.seqs[slot] = seq
+        self.seqs[self.slots] = seq
+        return seq
+
+    def write(self, frame):
+        slot, view = self.begin_write()
+        view[...] = frame
+        return slot, self.commit(slot)
+
+    # Decode the next frame of a cv2.VideoCapture directly into the ring. Returns
+    # (slot, seq), or None when the capture has no frame. Raises ValueError when
+    # the frame does not fit the ring, e.g. after the stream changed resolution.
+    def read_capture(self, cap):
+        slot, view = self.begin_write()
+        ret, image = cap.read(view)
+        if not ret:
+            return None
+        if image is not None and not np.shares_memory(image, view):
+            if image.shape != view.shape or image.dtype != view.dtype:
+                raise ValueError(f"Frame of shape {image.shape} does not fit a ring of {view.shape}")
+            view[...] = image
+        return slot, self.commit(slot)
+
+    # (slot, seq) of the newest committed frame, or None before the first one
+    def latest(self):
+        seq = int(self.seqs[self.slots])
+        return (seq % self.slots, seq) if seq >= 0 else None
+
+    # Reader side: a zero-copy view of the frame, or None if it was overwritten
+    def view(self, slot, seq):
+        return self.frames[slot] if self.valid(slot, seq) else None
+
+    # Check again after using a view: False means the writer lapped the reader
+    # while the frame was being processed
+    def valid(self, slot, seq):
+        return int(self.seqs[slot]) == seq
+
+    def close(self):
+        # Views must go before the buffer can be released
+        del self.seqs, self.frames
+        if self.owner:
+            self.shm.unlink()
+        try:
+            self.shm.close()
+        except BufferError:
+            # Frames handed out still view the memory; it is unmapped with them
+            pass
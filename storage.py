@@ -0,0 +1,301 @@
+import csv
+import os
+import queue
+import threading
+from datetime import datetime
+
+import cv2
+
+from config import settings
+
+_STOP = object()
+
+_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+_EXTENSIONS = {"png": ".png", "jpeg": ".jpg", "jpg": ".jpg", "webp": ".webp"}
+
+
+# Background writer for plate crops. Encoding and writing happen on a worker
+# thread behind a bounded queue, so slow disks never stall inference or the video
+# display. When the queue is full the "drop_oldest" policy discards the oldest
+# pending crop, while "block" makes the caller wait.
+class PlateWriter:
+    def __init__(self, image_format="png", png_compression=3, quality=90, queue_size=64, policy="drop_oldest"):
+        if image_format not in _EXTENSIONS:
+            raise ValueError(f"Unsupported image format: {image_format}")
+        if policy not in ("drop_oldest", "block"):
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        self.extension = _EXTENSIONS[image_format]
+        self.params = self._encode_params(image_format, png_compression, quality)
+        self.policy = policy
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._run, name="plate-writer", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_config(cls, storage=None):
+        storage = storage or settings["storage"]
+        return cls(image_format=storage["format"], png_compression=storage["png_compression"],
+                   quality=storage["quality"], queue_size=storage["queue_size"], policy=storage["policy"])
+
+    @staticmethod
+    def _encode_params(image_format, png_compression, quality):
+        if image_format == "png":
+            return [cv2.IMWRITE_PNG_COMPRESSION, int(png_compression)]
+        if image_format == "webp":
+            return [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+        return [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+
+    # Queue a BGR image for writing. path is given without an extension; the one
+    # matching the configured format is added and the final path is returned.
+    # on_written(path) is called from the writer thread once the file exists.
+    def save(self, path, image, on_written=None):
+        path = path + self.extension
+        item = (path, image.copy(), on_written)
+        if self.policy == "block":
+            self.queue.put(item)
+            return path
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return path
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.queue.task_done()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    # Wait until every queued crop has been written
+    def flush(self):
+        self.queue.join()
+
+    def close(self):
+        if self._thread.is_alive():
+            self.queue.put(_STOP)
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is _STOP:
+                    return
+                path, image, on_written = item
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                if cv2.imwrite(path, image, self.params):
+                    self.written += 1
+                    if on_written is not None:
+                        on_written(path)
+                else:
+                    self.failed += 1
+            except (cv2.error, OSError):
+                self.failed += 1
+            finally:
+                self.queue.task_done()
+
+
+# text is the final read of the crop's track; it was added last so indexes
+# written without it still load
+_INDEX_FIELDS = ["action", "id", "timestamp", "camera", "track", "path", "text"]
+
+
+# Saved plate crops, sharded into <root>/<YYYY-MM-DD>/<HH>/ so no directory grows
+# without bound. Names carry a millisecond timestamp, the camera, the track and a
+# monotonic id, so two plates in the same second never overwrite each other.
+# Every save and removal is appended to <root>/index.csv; the index is loaded once
+# and answers listings and lookups without scanning the directory tree.
+class PlateStore:
+    def __init__(self, root, writer=None):
+        self.root = root
+        self.writer = writer or PlateWriter.from_config()
+        self.index_path = os.path.join(root, "index.csv")
+        self.entries_by_id = {}
+        self.ids_by_path = {}
+        self.next_id = 1
+        self._lock = threading.Lock()
+        self._listeners = []
+        os.makedirs(root, exist_ok=True)
+        if os.path.exists(self.index_path):
+            self._load_index()
+        else:
+            self.rebuild_index()
+
+    def _load_index(self):
+        removed = 0
+        with open(self.index_path, 'r', newline='') as index_file:
+            for row in csv.DictReader(index_file, fieldnames=_INDEX_FIELDS):
+                plate_id = int(row.pop("id"))
+                self.next_id = max(self.next_id, plate_id + 1)
+                if row.pop("action") == "-":
+                    removed += 1
+                    self._forget(plate_id)
+                else:
+                    row["id"] = plate_id
+                    row["text"] = row["text"] or ""
+                    self.entries_by_id[plate_id] = row
+                    self.ids_by_path[row["path"]] = plate_id
+        if removed > len(self.entries_by_id):
+            self._rewrite_index()
+
+    # Index every image already under root, including crops saved flat in the
+    # root by older versions. Only needed once, when index.csv is missing.
+    def rebuild_index(self):
+        with self._lock:
+            self.entries_by_id = {}
+            self.ids_by_path = {}
+            found = []
+            for directory, _, file_names in os.walk(self.root):
+                for file_name in file_names:
+                    if os.path.splitext(file_name)[1].lower() in (".png", ".jpg", ".webp"):
+                        full_path = os.path.join(directory, file_name)
+                        found.append((os.path.getmtime(full_path), self.relative_path(full_path)))
+            for mtime, path in sorted(found):
+                entry = {"id": self.next_id, "timestamp": datetime.fromtimestamp(mtime).strftime(_TIMESTAMP_FORMAT)[:-3],
+                         "camera": "", "track": "", "path": path, "text": ""}
+                self.entries_by_id[self.next_id] = entry
+                self.ids_by_path[path] = self.next_id
+                self.next_id += 1
+            self._rewrite_index()
+
+    def _rewrite_index(self):
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, 'w', newline='') as index_file:
+            writer = csv.writer(index_file)
+            for entry in self.entries_by_id.values():
+                writer.writerow(["+"] + [entry[field] for field in _INDEX_FIELDS[1:]])
+        os.replace(temp_path, self.index_path)
+
+    def _append_index(self, action, entry):
+        with open(self.index_path, 'a', newline='') as index_file:
+            csv.writer(index_file).writerow([action] + [entry[field] for field in _INDEX_FIELDS[1:]])
+
+    # callback(action, entry) is called with action "add" once a saved crop has
+    # been written to disk and with "delete" when an entry is removed, so views can
+    # follow the store row by row. Callbacks run on the writer or caller thread.
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, action, entry):
+        for callback in list(self._listeners):
+            callback(action, entry)
+
+    # Index a crop once its file exists, so a crop the writer dropped (or failed
+    # to write) never leaves an entry behind
+    def _on_written(self, entry):
+        with self._lock:
+            self.entries_by_id[entry["id"]] = entry
+            self.ids_by_path[entry["path"]] = entry["id"]
+            self._append_index("+", entry)
+        self._notify("add", entry)
+
+    def _forget(self, plate_id):
+        entry = self.entries_by_id.pop(plate_id, None)
+        if entry is not None:
+            self.ids_by_path.pop(entry["path"], None)
+        return entry
+
+    def relative_path(self, path):
+        if os.path.isabs(path) or path.startswith(self.root):
+            path = os.path.relpath(path, self.root)
+        return path.replace(os.sep, "/")
+
+    def full_path(self, path):
+        return os.path.join(self.root, *self.relative_path(path).split("/"))
+
+    # Queue a crop for writing. It is indexed (and listeners hear "add") once the
+    # writer has written it. text is the plate read it stands for, e.g. the
+    # consensus of its track. Returns the entry it will have.
+    def save(self, image, camera_id="default", track_id=None, when=None, text=""):
+        when = when or datetime.now()
+        with self._lock:
+            plate_id = self.next_id
+            self.next_id += 1
+        stamp = when.strftime("%Y%m%d_%H%M%S_%f")[:-3]
+        track = "" if track_id is None else str(track_id)
+        name = f"plate_{stamp}_{camera_id}_{track or 'x'}_{plate_id}"
+        stem = "/".join([when.strftime("%Y-%m-%d"), when.strftime("%H"), name])
+        entry = {"id": plate_id, "timestamp": when.strftime(_TIMESTAMP_FORMAT)[:-3],
+                 "camera": camera_id, "track": track, "path": stem + self.writer.extension, "text": text}
+        # Outside the lock: with the "block" policy this waits for the writer,
+        # whose callback takes the lock
+        self.writer.save(self.full_path(stem), image, lambda _: self._on_written(entry))
+        return entry
+
+    def get(self, plate_id):
+        return self.entries_by_id.get(int(plate_id))
+
+    def find(self, path):
+        plate_id = self.ids_by_path.get(self.relative_path(path))
+        return self.entries_by_id.get(plate_id) if plate_id is not None else None
+
+    # Entries newest first, optionally limited to one day ("YYYY-MM-DD") and hour
+    def entries(self, day=None, hour=None):
+        with self._lock:
+            entries = list(self.entries_by_id.values())
+        if day is not None:
+            prefix = day + ("/%02d/" % int(hour) if hour is not None else "/")
+            entries = [entry for entry in entries if entry["path"].startswith(prefix)]
+        return sorted(entries, key=lambda entry: entry["id"], reverse=True)
+
+    # Drop a crop from the index; the file is deleted unless delete_file is False
+    # (e.g. when it has been moved elsewhere by the user).
+    def remove(self, path, delete_file=True):
+        with self._lock:
+            plate_id = self.ids_by_path.get(self.relative_path(path))
+            entry = self._forget(plate_id) if plate_id is not None else None
+            if entry is not None:
+                self._append_index("-", entry)
+        if delete_file:
+            full_path = self.full_path(path)
+            if os.path.exists(full_path):
+                os.remove(full_path)
+        if entry is not None:
+            self._notify("delete", entry)
+        return entry
+
+    def close(self):
+        self.writer.close()
+
+
+# Full paths of the plate crops under root, or with captures=True of the full
+# frames the GUIs saved with camera_id "capture". Read-only: from index.csv when
+# there is one, otherwise by walking the directory (captures are then told apart
+# by their name). Unlike PlateStore this starts no writer and never rewrites the
+# index, so offline tools can read a live store.
+def crop_paths(root, captures=False):
+    index_path = os.path.join(root, "index.csv")
+    if not os.path.exists(index_path):
+        return [os.path.join(directory, file_name)
+                for directory, _, file_names in os.walk(root) for file_name in sorted(file_names)
+                if os.path.splitext(file_name)[1].lower() in (".png", ".jpg", ".webp")
+                and ("_capture_" in file_name) == captures]
+    paths = {}
+    with open(index_path, 'r', newline='') as index_file:
+        for row in csv.DictReader(index_file, fieldnames=_INDEX_FIELDS):
+            if row["action"] == "-":
+                paths.pop(row["id"], None)
+            elif (row["camera"] == "capture") == captures:
+                paths[row["id"]] = os.path.join(root, *row["path"].split("/"))
+    return list(paths.values())
+
+
+_default_store = None
+
+
+# Store shared by every window of the process, rooted at the configured directory
+def default_store():
+    global _default_store
+    if _default_store is None:
+        _default_store = PlateStore(settings["storage"]["directory"])
+    return _default_store
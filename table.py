@@ -1,70 +1,42 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
 from PIL import Image, ImageTk
+import cv2
 import os
-import csv
-from datetime import datetime
-
-base_csv_dir = "csv_files"
-saved_plate_dir = 'D:\\oman_car_plates\\saved_plates'
-
-if not os.path.exists(base_csv_dir):
-    os.makedirs(base_csv_dir)
-
-# Function to get today's directory and CSV file
-def get_today_csv_path():
-    today_str = datetime.now().strftime("%Y-%m-%d")
-    today_dir = os.path.join(base_csv_dir, today_str)
-    if not os.path.exists(today_dir):
-        os.makedirs(today_dir)
-    csv_path = os.path.join(today_dir, 'plates_data.csv')
-    return csv_path
-
-# Function to load data from today's CSV
-def load_data_from_csv():
-    data = []
-    csv_path = get_today_csv_path()
-    if os.path.exists(csv_path):
-        with open(csv_path, 'r') as csvfile:
-            reader = csv.DictReader(csvfile)
-            data = list(reader)
-    return data
-
-# Function to write data to today's CSV
-def write_data_to_csv(data):
-    csv_path = get_today_csv_path()
-    with open(csv_path, 'w', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=data[0].keys() if data else ['name', 'timestamp', 'plate_file'])
-        writer.writeheader()
-        writer.writerows(data)
-
-# Function to add a name to the selected plate
-def add_name(plate_file, table, item):
+import queue
+from storage import default_store
+from registry import default_registry
+from owners import normalize_plate
+from thumbnails import ThumbnailCache
+
+plate_store = default_store()
+plate_registry = default_registry()
+thumbnail_cache = ThumbnailCache.from_config()
+page_size = 100  # Rows materialized in the Treeview at a time
+
+# Function to add a name to the selected plate; open views update through the registry's change feed
+def add_name(plate_file):
     name = simpledialog.askstring("Input", "Enter the person's name:")
     if name:
-        data_list = load_data_from_csv()
-
         # Check if the name already exists
-        for record in data_list:
-            if record['name'] == name:
-                messagebox.showerror("Error", f"The name '{name}' already exists.")
-                return
+        if plate_registry.find_by_name(name):
+            messagebox.showerror("Error", f"The name '{name}' already exists.")
+            return
 
         # Check if the plate file already exists
-        for record in data_list:
-            if record['plate_file'] == plate_file:
-                messagebox.showerror("Error", "This plate image already exists.")
-                return
-
-        # If not, add the name to the CSV
-        timestamp = plate_file.split('_')[1].replace(".png", "")
-        data = {'name': name, 'timestamp': timestamp, 'plate_file': plate_file}
-        data_list.append(data)
-
-        write_data_to_csv(data_list)
-        
-        # Update Treeview directly
-        table.item(item, values=(plate_file, timestamp, name))
+        if plate_registry.find_by_plate_file(plate_file):
+            messagebox.showerror("Error", "This plate image already exists.")
+            return
+
+        # The plate number is what the gate matches reads against; the final read
+        # stored with the crop is offered as a starting point
+        entry = plate_store.find(plate_file)
+        plate_text = simpledialog.askstring("Input", "Enter the plate number (optional):",
+                                            initialvalue=entry.get('text', "") if entry else "") or ""
+
+        # If not, add the name to the registry
+        timestamp = entry['timestamp'] if entry else ""
+        plate_registry.add(name, plate_file=plate_file, timestamp=timestamp, plate_text=normalize_plate(plate_text))
         messagebox.showinfo("Info", "Name added successfully.")
 
 
@@ -72,46 +44,46 @@ def add_name(plate_file, table, item):
 def save_plate(plate_file):
     save_path = filedialog.asksaveasfilename(defaultextension=".png", filetypes=[("PNG files", "*.png")], initialfile=os.path.basename(plate_file))
     if save_path:
-        os.rename(plate_file, save_path)
+        thumbnail_cache.discard(plate_store.full_path(plate_file))
+        os.rename(plate_store.full_path(plate_file), save_path)
+        plate_store.remove(plate_file, delete_file=False)
         messagebox.showinfo("Info", "Plate image saved.")
 
-# Function to delete the selected plate image
-def delete_plate(plate_file, table, item):
-    os.remove(plate_file)
-    table.delete(item)
-    
-    # Remove from CSV file
-    data_list = load_data_from_csv()
-    data_list = [record for record in data_list if record['plate_file'] != plate_file]
+# Function to delete the selected plate image; open views drop its row through the store's change feed
+def delete_plate(plate_file):
+    thumbnail_cache.discard(plate_store.full_path(plate_file))
+    plate_store.remove(plate_file)
     
-    write_data_to_csv(data_list)
+    # Remove from the registry
+    plate_registry.delete_by_plate_file(plate_file)
 
     messagebox.showinfo("Info", "Plate image deleted.")
 
 # Function to save all plate data as a CSV file
-def save_as_csv(data):
+def save_as_csv():
     save_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv")], initialfile="plates_data.csv")
     if save_path:
-        write_data_to_csv(data)
+        plate_registry.export_csv(save_path)
         messagebox.showinfo("Info", "CSV file saved.")
 
-# Function to delete all plates from the table
-def delete_all_plates(table):
-    for item in table.get_children():
-        plate_file = table.item(item, "values")[0]
-        os.remove(os.path.join(saved_plate_dir, plate_file))
-    table.delete(*table.get_children())
+# Function to delete all saved plates, not only the page shown in the table
+def delete_all_plates():
+    plate_files = [entry['path'] for entry in plate_store.entries()]
+    for plate_file in plate_files:
+        thumbnail_cache.discard(plate_store.full_path(plate_file))
+        plate_store.remove(plate_file)
     
-    # Clear CSV file
-    csv_path = get_today_csv_path()
-    open(csv_path, 'w').close()
+    # Remove their records from the registry
+    plate_registry.delete_plate_files(plate_files)
     
     messagebox.showinfo("Info", "All plates deleted.")
 
-# Function to display the table of saved plates
+# Function to display the table of saved plates. Only one page of rows exists in
+# the Treeview at a time and thumbnails are loaded by the thumbnail cache in the
+# background, so the window opens at once however many crops are saved. The view
+# follows the change feeds of the store and the registry row by row, so plates
+# saved by a running detector appear without reopening it.
 def show_saved_plates(root):
-    plate_files = [f for f in os.listdir(saved_plate_dir) if os.path.isfile(os.path.join(saved_plate_dir, f))]
-
     top = tk.Toplevel(root)
     top.title("Saved Plates")
     top.geometry("1000x600")
@@ -122,11 +94,12 @@ def show_saved_plates(root):
     # Create a style for the Treeview
     style = ttk.Style()
 
-    # Configure the Treeview background and foreground
+    # Configure the Treeview background and foreground; rows are as tall as a thumbnail
     style.configure("Treeview",
                     background="beige",
                     foreground="darkgreen",
-                    fieldbackground="beige")
+                    fieldbackground="beige",
+                    rowheight=thumbnail_cache.size[1] + 4)
 
     # Configure the Treeview heading
     style.configure("Treeview.Heading",
@@ -138,11 +111,13 @@ def show_saved_plates(root):
             background=[('selected', 'darkolivegreen')],
             foreground=[('selected', 'beige')])
 
-    table = ttk.Treeview(table_frame, columns=("Image", "Timestamp", "Name"), show="headings", style="Treeview")
+    table = ttk.Treeview(table_frame, columns=("Image", "Timestamp", "Name"), show="tree headings", style="Treeview")
+    table.heading("#0", text="Plate")
     table.heading("Image", text="Plate Image")
     table.heading("Timestamp", text="Timestamp")
     table.heading("Name", text="Name")
 
+    table.column("#0", anchor=tk.CENTER, width=thumbnail_cache.size[0] + 20, stretch=False)
     table.column("Image", anchor=tk.CENTER, width=300)
     table.column("Timestamp", anchor=tk.CENTER, width=200)
     table.column("Name", anchor=tk.CENTER, width=200)
@@ -152,67 +127,179 @@ def show_saved_plates(root):
     scroll_y.pack(side=tk.RIGHT, fill=tk.Y)
     table.pack(fill=tk.BOTH, expand=True)
 
-    # Refresh the data and update the table
-    data = load_data_from_csv()
-    table.delete(*table.get_children())  # Clear existing data
-
-    for plate_file in plate_files:
-        plate_path = os.path.join(saved_plate_dir, plate_file)
-        timestamp = plate_file.split('_')[1].replace(".png", "")
-        img = Image.open(plate_path)
-        img.thumbnail((200, 200))
-        img_tk = ImageTk.PhotoImage(img)
-
-        # Find existing data for the plate_file
-        name = ""
-        for record in data:
-            if record['plate_file'] == plate_file:
-                name = record['name']
+    nav_frame = tk.Frame(top)
+    nav_frame.pack(pady=5)
+    prev_btn = tk.Button(nav_frame, text="< Prev", command=lambda: show_page(current_page[0] - 1))
+    prev_btn.pack(side=tk.LEFT, padx=5)
+    page_label = tk.Label(nav_frame, text="")
+    page_label.pack(side=tk.LEFT, padx=5)
+    next_btn = tk.Button(nav_frame, text="Next >", command=lambda: show_page(current_page[0] + 1))
+    next_btn.pack(side=tk.LEFT, padx=5)
+
+    # One preview panel for whichever row is selected
+    preview_frame = tk.Frame(top)
+    preview_frame.pack(pady=5)
+    preview_label = tk.Label(preview_frame)
+    preview_label.pack(side=tk.LEFT, padx=5)
+
+    btn_frame = tk.Frame(top)
+    btn_frame.pack(pady=5)
+    selected = [None]
+
+    save_btn = tk.Button(btn_frame, text="Save As PNG", command=lambda: save_plate(selected[0]))
+    save_btn.pack(side=tk.LEFT, padx=5)
+
+    add_name_btn = tk.Button(btn_frame, text="Add Name", command=lambda: add_name(selected[0]))
+    add_name_btn.pack(side=tk.LEFT, padx=5)
+
+    delete_btn = tk.Button(btn_frame, text="Delete", command=lambda: delete_plate(selected[0]))
+    delete_btn.pack(side=tk.LEFT, padx=5)
+
+    save_csv_btn = tk.Button(btn_frame, text="Save As CSV", command=save_as_csv)
+    save_csv_btn.pack(side=tk.LEFT, padx=5)
+
+    delete_all_btn = tk.Button(btn_frame, text="Delete All", command=delete_all_plates)
+    delete_all_btn.pack(side=tk.LEFT, padx=5)
+
+    row_buttons = (save_btn, add_name_btn, delete_btn)
+
+    current_page = [0]
+    known = set()  # Paths of every entry counted in "(N plates)"
+    names = {}
+    photos = {}  # Keep references to the thumbnails of the page being shown
+    requested = {}  # Full path of each requested thumbnail -> row
+    updates = queue.Queue()  # Thumbnails and change-feed events, applied on the Tk thread
+
+    def on_thumbnail(path, image):
+        updates.put(("thumbnail", path, image))
+
+    def on_store_change(action, entry):
+        updates.put(("store", action, entry))
+
+    def on_registry_change(action, record):
+        updates.put(("registry", action, record))
+
+    def show_thumbnail(plate_file, image):
+        if image is None or not table.exists(plate_file):
+            return
+        photo = ImageTk.PhotoImage(Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)))
+        photos[plate_file] = photo
+        table.item(plate_file, image=photo)
+
+    def insert_row(entry, index=tk.END):
+        plate_file = entry['path']
+        table.insert('', index, iid=plate_file, values=(plate_file, entry['timestamp'], names.get(plate_file, "")))
+        plate_path = plate_store.full_path(plate_file)
+        requested[plate_path] = plate_file
+        image = thumbnail_cache.request(plate_path, on_thumbnail)
+        if image is not None:
+            show_thumbnail(requested.pop(plate_path), image)
+
+    def remove_row(plate_file):
+        if table.exists(plate_file):
+            table.delete(plate_file)
+        photos.pop(plate_file, None)
+        if selected[0] == plate_file:
+            show_preview(None)
+
+    def update_page_label():
+        page_count = max(1, (len(known) + page_size - 1) // page_size)
+        page_label.config(text=f"Page {current_page[0] + 1} / {page_count} ({len(known)} plates)")
+        prev_btn.config(state="normal" if current_page[0] > 0 else "disabled")
+        next_btn.config(state="normal" if current_page[0] < page_count - 1 else "disabled")
+
+    def show_page(page):
+        entries = plate_store.entries()
+        # Names are looked up by plate file in a dict, kept current by the registry feed
+        names.clear()
+        names.update((record['plate_file'], record['name']) for record in plate_registry.records())
+        page_count = max(1, (len(entries) + page_size - 1) // page_size)
+        current_page[0] = min(max(page, 0), page_count - 1)
+        known.clear()
+        known.update(entry['path'] for entry in entries)
+
+        thumbnail_cache.cancel_pending()
+        table.delete(*table.get_children())  # Clear existing data
+        photos.clear()
+        requested.clear()
+        start = current_page[0] * page_size
+        for entry in entries[start:start + page_size]:
+            insert_row(entry)
+        update_page_label()
+
+    # Apply one change to the rows that are materialized. Entries are listed
+    # newest first, so a new crop only shows up on the first page.
+    def apply_update(kind, action, item):
+        if kind == "thumbnail":
+            if action in requested:
+                show_thumbnail(requested.pop(action), item)
+        elif kind == "store" and action == "add":
+            # A refresh may already have listed (and counted) this entry
+            if item['path'] in known:
+                return
+            known.add(item['path'])
+            if current_page[0] == 0 and not table.exists(item['path']):
+                insert_row(item, 0)
+                rows = table.get_children()
+                if len(rows) > page_size:
+                    remove_row(rows[-1])
+        elif kind == "store":
+            known.discard(item['path'])
+            remove_row(item['path'])
+        else:
+            plate_file = item['plate_file']
+            if action == "add":
+                names[plate_file] = item['name']
+            elif names.get(plate_file) == item['name']:
+                names.pop(plate_file)
+            if table.exists(plate_file):
+                table.set(plate_file, "Name", names.get(plate_file, ""))
+
+    def poll_updates():
+        if not top.winfo_exists():
+            return
+        changed = False
+        while True:
+            try:
+                kind, action, item = updates.get_nowait()
+            except queue.Empty:
                 break
-        
-        table.insert('', tk.END, iid=plate_file, values=(plate_file, timestamp, name), image=img_tk)
-    
+            apply_update(kind, action, item)
+            changed = changed or kind == "store"
+        if changed:
+            update_page_label()
+        top.after(50, poll_updates)
+
+    def show_preview(plate_file):
+        selected[0] = plate_file
+        image = None
+        if plate_file is not None and os.path.exists(plate_store.full_path(plate_file)):
+            img = Image.open(plate_store.full_path(plate_file))
+            img.thumbnail((300, 300))
+            image = ImageTk.PhotoImage(img)
+        preview_label.config(image=image or '')
+        preview_label.image = image  # Keep reference to prevent garbage collection
+        for button in row_buttons:
+            button.config(state="normal" if image is not None else "disabled")
+
     # Function to handle row selection
     def on_select(event):
-        item = table.selection()[0]
-        plate_file = table.item(item, "values")[0]
-
-        # Clear previous widgets
-        for widget in top.winfo_children():
-            if isinstance(widget, tk.Frame) and widget != table_frame:
-                widget.destroy()
-
-        # Display the selected plate image and controls
-        img_frame = tk.Frame(top)
-        img_frame.pack(pady=5)
-
-        img = Image.open(os.path.join(saved_plate_dir, plate_file))
-        img.thumbnail((300, 300))
-        img_tk = ImageTk.PhotoImage(img)
-
-        img_label = tk.Label(img_frame, image=img_tk)
-        img_label.image = img_tk  # Keep reference to prevent garbage collection
-        img_label.pack(side=tk.LEFT, padx=5)
-
-        btn_frame = tk.Frame(top)
-        btn_frame.pack(pady=5)
-
-        save_btn = tk.Button(btn_frame, text="Save As PNG", command=lambda: save_plate(os.path.join(saved_plate_dir, plate_file)))
-        save_btn.pack(side=tk.LEFT, padx=5)
-
-        add_name_btn = tk.Button(btn_frame, text="Add Name", command=lambda: add_name(os.path.join(saved_plate_dir, plate_file), table, item))
-        add_name_btn.pack(side=tk.LEFT, padx=5)
-
-        delete_btn = tk.Button(btn_frame, text="Delete", command=lambda: delete_plate(os.path.join(saved_plate_dir, plate_file), table, item))
-        delete_btn.pack(side=tk.LEFT, padx=5)
-
-        save_csv_btn = tk.Button(btn_frame, text="Save As CSV", command=lambda: save_as_csv(load_data_from_csv()))
-        save_csv_btn.pack(side=tk.LEFT, padx=5)
+        if table.selection():
+            show_preview(table.selection()[0])
 
-        delete_all_btn = tk.Button(btn_frame, text="Delete All", command=lambda: delete_all_plates(table))
-        delete_all_btn.pack(side=tk.LEFT, padx=5)
+    # Stop following the feeds once the window is gone
+    def on_destroy(event):
+        if event.widget is top:
+            plate_store.remove_listener(on_store_change)
+            plate_registry.remove_listener(on_registry_change)
 
     table.bind('<<TreeviewSelect>>', on_select)
+    top.bind('<Destroy>', on_destroy)
+    plate_store.add_listener(on_store_change)
+    plate_registry.add_listener(on_registry_change)
+    show_preview(None)
+    show_page(0)
+    poll_updates()
 
 # Integrating with the main Tkinter application
 def main():
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import queue
+import threading
+from collections import OrderedDict
+
+import cv2
+
+from config import settings
+
+
+# Thumbnails of saved plate crops for the saved-plates browser. Each thumbnail is
+# stored under directory with a name derived from the crop's path, mtime and the
+# thumbnail size, so a replaced crop never shows a stale thumbnail and nothing
+# has to be invalidated by hand. Missing thumbnails are generated by worker
+# threads; recently used ones are also kept in memory, keyed by path and mtime
+# as well.
+class ThumbnailCache:
+    def __init__(self, directory, size=(160, 60), workers=2, memory_items=512):
+        self.directory = directory
+        self.size = tuple(size)
+        self.memory_items = memory_items
+        self.memory = OrderedDict()
+        self.queue = queue.Queue()
+        self.pending = set()
+        self.generated = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        for number in range(workers):
+            threading.Thread(target=self._run, name=f"thumbnails-{number}", daemon=True).start()
+
+    @classmethod
+    def from_config(cls, storage=None):
+        storage = storage or settings["storage"]
+        return cls(storage["thumbnail_dir"], storage["thumbnail_size"])
+
+    def _cache_path(self, path):
+        stat = os.stat(path)
+        key = f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{self.size[0]}x{self.size[1]}"
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + ".png")
+
+    # Key of the in-memory cache; raises OSError when the crop is missing
+    def _memory_key(self, path):
+        return path, os.stat(path).st_mtime_ns
+
+    def _remember(self, key, image):
+        with self._lock:
+            self.memory[key] = image
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_items:
+                self.memory.popitem(last=False)
+
+    # The BGR thumbnail of the crop at path, read from the cache or generated now.
+    # Returns None when the crop is missing or unreadable.
+    def get(self, path):
+        try:
+            key = self._memory_key(path)
+        except OSError:
+            return None
+        with self._lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key]
+        try:
+            cache_path = self._cache_path(path)
+        except OSError:
+            return None
+        image = cv2.imread(cache_path) if os.path.exists(cache_path) else None
+        if image is None:
+            image = self._generate(path, cache_path)
+        if image is not None:
+            self._remember(key, image)
+        return image
+
+    def _generate(self, path, cache_path):
+        image = cv2.imread(path)
+        if image is None:
+            self.failed += 1
+            return None
+        height, width = image.shape[:2]
+        scale = min(self.size[0] / width, self.size[1] / height, 1.0)
+        if scale < 1.0:
+            image = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))),
+                               interpolation=cv2.INTER_AREA)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        cv2.imwrite(cache_path, image)
+        self.generated += 1
+        return image
+
+    # Ask for a thumbnail without waiting. A thumbnail already in memory is
+    # returned directly; otherwise None is returned and callback(path, image) is
+    # called from a worker thread once it is ready (image is None on failure).
+    def request(self, path, callback):
+        try:
+            key = self._memory_key(path)
+        except OSError:
+            key = None
+        with self._lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key]
+            if path in self.pending:
+                return None
+            self.pending.add(path)
+        self.queue.put((path, callback))
+        return None
+
+    # Drop requests that have not started, e.g. when the browser changes page
+    def cancel_pending(self):
+        while True:
+            try:
+                path, _ = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self.pending.discard(path)
+
+    # Forget the thumbnail of a crop that is about to be deleted or moved
+    def discard(self, path):
+        with self._lock:
+            for key in [key for key in self.memory if key[0] == path]:
+                del self.memory[key]
+        try:
+            cache_path = self._cache_path(path)
+        except OSError:
+            return
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+
+    def _run(self):
+        while True:
+            path, callback = self.queue.get()
+            try:
+                image = self.get(path)
+            except (cv2.error, OSError):
+                self.failed += 1
+                image = None
+            with self._lock:
+                self.pending.discard(path)
+            callback(path, image)
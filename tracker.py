@@ -0,0 +1,153 @@
+import itertools
+
+from consensus import PlateVoter
+
+
+def box_iou(a, b):
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    union = box_area(a) + box_area(b) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def box_area(box):
+    return max(0, box[2] - box[0]) * max(0, box[3] - box[1])
+
+
+def box_center(box):
+    return (box[0] + box[2]) / 2.0, (box[1] + box[3]) / 2.0
+
+
+# One vehicle followed across frames. The plate and character stages only run
+# for it while needs_read() is true; the best read so far is kept on the track,
+# and the reads of every frame vote for the final plate text.
+class Track:
+    def __init__(self, track_id, box, quality_gain, voter=None, max_reads=20):
+        self.id = track_id
+        self.box = box
+        self.hits = 1
+        self.missed = 0
+        self.quality_gain = quality_gain
+        self.read_quality = 0
+        self.best_quality = 0
+        self.best_plate = None
+        self.best_read = None
+        self.reads = 0
+        self.voter = voter
+        self.max_reads = max_reads
+        self.final_read = None
+
+    # A track is read when it is new and while its reads are still being voted on.
+    # Once voting settles (or gives up after max_reads) it is only read again when
+    # the car has grown enough (usually by moving closer) that a better crop is
+    # likely, and never again after consensus.
+    def needs_read(self):
+        if self.final_read is not None:
+            return False
+        if self.reads == 0 or (self.voter is not None and self.reads < self.max_reads):
+            return True
+        return box_area(self.box) > self.read_quality * self.quality_gain
+
+    # plates and reads come from PipelineModel.read_vehicles, one read per plate
+    def add_read(self, plates, reads):
+        self.reads += 1
+        self.read_quality = box_area(self.box)
+        frame_read = None
+        frame_quality = 0
+        for plate, read in zip(plates, reads):
+            quality = box_area(plate[:4])
+            if quality > frame_quality:
+                frame_quality = quality
+                frame_read = read
+            if quality > self.best_quality:
+                self.best_quality = quality
+                self.best_plate = plate
+                self.best_read = read
+        if self.voter is not None and frame_read is not None:
+            self.final_read = self.voter.add(frame_read)
+
+    # The agreed read once voting has settled, otherwise the read of the best crop
+    @property
+    def read(self):
+        return self.final_read if self.final_read is not None else self.best_read
+
+    @property
+    def best_characters(self):
+        return self.read.characters if self.read is not None else []
+
+
+# Lightweight IoU tracker over the car boxes of PipelineModel.detect_cars. Boxes
+# are matched greedily by IoU, with a centroid-distance fallback for fast cars
+# whose boxes no longer overlap between processed frames.
+class VehicleTracker:
+    def __init__(self, iou_threshold=0.3, max_missed=15, quality_gain=1.2, max_center_shift=0.5,
+                 vote_window=10, vote_threshold=0.7, min_votes=3):
+        self.vote_window = vote_window
+        self.vote_threshold = vote_threshold
+        self.min_votes = min_votes
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.quality_gain = quality_gain
+        self.max_center_shift = max_center_shift
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+    def reset(self):
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+    # Match the boxes of a new frame to existing tracks. Returns the tracks seen in
+    # this frame and the tracks that have just been finalized (gone for longer than
+    # max_missed frames), each of which carries its single best read.
+    def update(self, boxes):
+        boxes = [tuple(map(int, box[:4])) for box in boxes]
+        unmatched_tracks = set(range(len(self.tracks)))
+        unmatched_boxes = set(range(len(boxes)))
+
+        pairs = []
+        for t, track in enumerate(self.tracks):
+            for b, box in enumerate(boxes):
+                iou = box_iou(track.box, box)
+                if iou >= self.iou_threshold:
+                    pairs.append((iou, t, b))
+        self._assign(sorted(pairs, reverse=True), unmatched_tracks, unmatched_boxes, boxes)
+
+        pairs = []
+        for t in unmatched_tracks:
+            track = self.tracks[t]
+            tx, ty = box_center(track.box)
+            limit = self.max_center_shift * max(track.box[2] - track.box[0], track.box[3] - track.box[1])
+            for b in unmatched_boxes:
+                bx, by = box_center(boxes[b])
+                distance = ((tx - bx) ** 2 + (ty - by) ** 2) ** 0.5
+                if distance <= limit:
+                    pairs.append((-distance, t, b))
+        self._assign(sorted(pairs, reverse=True), unmatched_tracks, unmatched_boxes, boxes)
+
+        for t in unmatched_tracks:
+            self.tracks[t].missed += 1
+        for b in sorted(unmatched_boxes):
+            voter = PlateVoter(self.vote_window, self.vote_threshold, self.min_votes) if self.vote_window else None
+            self.tracks.append(Track(next(self._ids), boxes[b], self.quality_gain, voter, 2 * self.vote_window))
+
+        finished = [track for track in self.tracks if track.missed > self.max_missed]
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+        active = [track for track in self.tracks if track.missed == 0]
+        return active, finished
+
+    # Finalize every remaining track, e.g. when a video ends
+    def flush(self):
+        finished = self.tracks
+        self.reset()
+        return finished
+
+    def _assign(self, pairs, unmatched_tracks, unmatched_boxes, boxes):
+        for _, t, b in pairs:
+            if t in unmatched_tracks and b in unmatched_boxes:
+                track = self.tracks[t]
+                track.box = boxes[b]
+                track.hits += 1
+                track.missed = 0
+                unmatched_tracks.discard(t)
+                unmatched_boxes.discard(b)